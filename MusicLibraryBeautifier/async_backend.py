@@ -0,0 +1,103 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import instrumentation
+from main import AlbumSnapshot, LibraryReport, _beautify_album_stages, _paths_overlap, discover_albums, is_disc_folder_name
+from plan import AlbumPlan, PlanApplier, operation_batches
+from state_cache import AlbumStateCache
+
+_default_concurrency = 32
+_default_per_mount_concurrency = 8
+_queued_albums_per_worker = 1
+
+class AsyncRunner:
+    # Runs blocking filesystem calls on a bounded thread pool; calls on the same device additionally
+    # share a per-mount semaphore, so one slow share cannot take every worker.
+    def __init__(self, concurrency: int = _default_concurrency, per_mount_concurrency: int = _default_per_mount_concurrency):
+        self.concurrency = concurrency
+        self.per_mount_concurrency = per_mount_concurrency
+        self._executor = ThreadPoolExecutor(max_workers = concurrency)
+        self._mount_semaphores = {}
+
+    def close(self):
+        self._executor.shutdown()
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def call(self, device, function, *args):
+        semaphore = self._mount_semaphores.get(device)
+        if semaphore is None:
+            semaphore = self._mount_semaphores[device] = asyncio.Semaphore(self.per_mount_concurrency)
+        async with semaphore:
+            return await self.run(function, *args)
+
+    async def device(self, path: Path):
+        stat = await self.run(os.stat, path)
+        return stat.st_dev
+
+async def prime_snapshot(runner: AsyncRunner, device, snapshot: AlbumSnapshot, folder: Path):
+    # Lists a whole album with every level's folders listed concurrently.
+    entries = await runner.call(device, snapshot.entries, folder)
+    subfolders = [folder / name for name, entry in list(entries.items()) if entry.is_dir]
+    await asyncio.gather(*(prime_snapshot(runner, device, snapshot, subfolder) for subfolder in subfolders))
+
+async def beautify_album_folder_async(runner: AsyncRunner, path: Path, applier: PlanApplier = None):
+    applier = PlanApplier() if applier is None else applier
+    instrumentation.event("album_started", album = str(path))
+    device = await runner.device(path)
+    plan = AlbumPlan(AlbumSnapshot._key(path))
+    snapshot = AlbumSnapshot(path, plan)
+    await prime_snapshot(runner, device, snapshot, snapshot.path)
+    # Every listing is in memory now, but planning still reads cue sheets and, with deduplication,
+    # hashes images, so it runs on the pool rather than on the event loop.
+    await runner.call(device, _beautify_album_stages, path, snapshot)
+    for batch in operation_batches(plan.operations):
+        await asyncio.gather(*(runner.call(device, applier.apply_operation, operation) for operation in batch))
+    instrumentation.event("album_finished", album = str(path))
+    return plan
+
+async def beautify_library_async(path: Path, concurrency: int = _default_concurrency,
+                                 per_mount_concurrency: int = _default_per_mount_concurrency,
+                                 state_cache: AlbumStateCache = None, record_paths: bool = True, shard = None):
+    report = LibraryReport(record_paths)
+    runner = AsyncRunner(concurrency, per_mount_concurrency)
+    applier = PlanApplier()
+    albums = iter(discover_albums(path, state_cache, shard))
+    pending = {}
+
+    async def beautify(album_path: Path):
+        try:
+            await beautify_album_folder_async(runner, album_path, applier)
+            if state_cache is not None:
+                await runner.run(state_cache.update, album_path, is_disc_folder_name)
+            report.add(album_path, None)
+        except Exception as error:
+            instrumentation.event("album_failed", album = str(album_path), error = repr(error))
+            report.add(album_path, repr(error))
+
+    async def collect_finished():
+        done, _ = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+        for task in done:
+            del pending[task]
+
+    try:
+        while True:
+            album_path = await runner.run(next, albums, None)
+            if album_path is None:
+                break
+            while len(pending) >= concurrency * _queued_albums_per_worker or any(_paths_overlap(album_path, queued) for queued in pending.values()):
+                await collect_finished()
+            pending[asyncio.ensure_future(beautify(album_path))] = album_path
+        while pending:
+            await collect_finished()
+    finally:
+        runner.close()
+    return report
+
+def beautify_library_with_asyncio(path: Path, concurrency: int = _default_concurrency,
+                                  per_mount_concurrency: int = _default_per_mount_concurrency,
+                                  state_cache: AlbumStateCache = None, record_paths: bool = True, shard = None):
+    return asyncio.run(beautify_library_async(path, concurrency, per_mount_concurrency, state_cache, record_paths, shard))
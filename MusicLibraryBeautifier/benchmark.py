@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from main import AlbumSnapshot, album_stages, beautify_library, iter_deepest_audio_folders
+
+_counted_functions = ["scandir", "stat", "lstat", "rename", "replace", "mkdir", "unlink", "rmdir"]
+_albums_per_artist = 5
+
+class SyscallCounter:
+    # Counts calls of the os functions the beautifier goes through while the context is active.
+    def __init__(self):
+        self.counts = dict.fromkeys(_counted_functions, 0)
+
+    def __enter__(self):
+        self._originals = {name: getattr(os, name) for name in _counted_functions}
+        for name, function in self._originals.items():
+            setattr(os, name, self._counting(name, function))
+        return self
+
+    def __exit__(self, *exception):
+        for name, function in self._originals.items():
+            setattr(os, name, function)
+
+    def _counting(self, name, function):
+        def counting_function(*args, **kwargs):
+            self.counts[name] += 1
+            return function(*args, **kwargs)
+        return counting_function
+
+    def total(self):
+        return sum(self.counts.values())
+
+def _create_file(path: Path, size: int):
+    path.parent.mkdir(parents = True, exist_ok = True)
+    with open(path, "wb") as file:
+        file.write(b"\0" * size)
+
+def _create_disc(folder: Path, options: dict, rng: random.Random, files: list):
+    if rng.random() < options["image_ratio"]:
+        names = ["album.flac", "album.cue", "album.log"]
+    else:
+        names = ["%02d - Track.flac" % number for number in range(1, options["tracks"] + 1)]
+        if rng.random() < 0.5:
+            names.append("rip.log")
+    if rng.random() < options["playlist_ratio"]:
+        names.append("album.m3u")
+    files.extend(folder / name for name in names)
+
+def generate_library(root: Path, albums: int = 100, tracks: int = 10, multi_cd_ratio: float = 0.2, scans_ratio: float = 0.5,
+                     image_ratio: float = 0.2, playlist_ratio: float = 0.5, collision_ratio: float = 0.3,
+                     file_size: int = 1024, seed: int = 0):
+    # Artist/Album folders with a mix of per-track and single-image rips, multi-CD sets, scans folders,
+    # playlists and covers that collide by name once flattened into Artwork.
+    options = {"tracks": tracks, "image_ratio": image_ratio, "playlist_ratio": playlist_ratio}
+    rng = random.Random(seed)
+    files = []
+    for album_number in range(albums):
+        album_path = Path(root) / ("Artist %03d" % (album_number // _albums_per_artist)) / ("Album %03d" % album_number)
+        if rng.random() < multi_cd_ratio:
+            for disc in range(1, rng.randint(2, 3) + 1):
+                _create_disc(album_path / ("CD" + str(disc)), options, rng, files)
+        else:
+            _create_disc(album_path, options, rng, files)
+        files.extend([album_path / "cover.jpg", album_path / "info.txt"])
+        if rng.random() < scans_ratio:
+            files.extend(album_path / "Scans" / ("page%02d.jpg" % page) for page in range(1, 5))
+            if rng.random() < collision_ratio:
+                files.extend([album_path / "Scans" / "cover.jpg", album_path / "Scans" / "Booklet" / "cover.jpg"])
+    for path in files:
+        _create_file(path, file_size)
+    return len(files)
+
+def _measure(function, file_count: int, album_count: int):
+    with SyscallCounter() as counter:
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "files_per_second": file_count / seconds if seconds else None,
+        "syscalls": counter.counts,
+        "syscalls_per_album": counter.total() / album_count if album_count else None,
+    }
+
+def _fresh_library(work_path: Path, generator_options: dict):
+    library_path = work_path / "library"
+    if library_path.exists():
+        shutil.rmtree(library_path)
+    file_count = generate_library(library_path, **generator_options)
+    return library_path, file_count
+
+def run_benchmark(work_path: Path, jobs: int = 1, **generator_options):
+    results = {"python": platform.python_version(), "platform": platform.platform(), "options": dict(generator_options, jobs = jobs)}
+    library_path, file_count = _fresh_library(work_path, generator_options)
+    albums = []
+    results["discovery"] = _measure(lambda: albums.extend(iter_deepest_audio_folders(library_path)), file_count, 1)
+    results["discovery"]["syscalls_per_album"] /= max(len(albums), 1)
+    results["files"] = file_count
+    results["albums"] = len(albums)
+
+    # The stages are the ones beautify_album_folder runs for each album, e.g. normalize_disc_folders for disc sets only.
+    stage_results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for album_path in albums:
+            snapshot = AlbumSnapshot(album_path)
+            for name, stage in album_stages(album_path, snapshot):
+                measurement = _measure(lambda: stage(album_path, snapshot), 0, 1)
+                stage_results.setdefault(name, {"seconds": 0.0, "syscalls": dict.fromkeys(_counted_functions, 0)})
+                stage_results[name]["seconds"] += measurement["seconds"]
+                for function, count in measurement["syscalls"].items():
+                    stage_results[name]["syscalls"][function] += count
+    for stage_result in stage_results.values():
+        stage_result["files_per_second"] = file_count / stage_result["seconds"] if stage_result["seconds"] else None
+        stage_result["syscalls_per_album"] = sum(stage_result["syscalls"].values()) / len(albums) if albums else None
+    results["stages"] = stage_results
+
+    library_path, file_count = _fresh_library(work_path, generator_options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["full"] = _measure(lambda: beautify_library(library_path, jobs), file_count, len(albums))
+    shutil.rmtree(library_path)
+    return results
+
+def _format_rate(value):
+    return "-" if value is None else "%.0f" % value
+
+def format_results(results: dict, baseline: dict = None):
+    rows = [("discovery", results["discovery"])] + list(results["stages"].items()) + [("full", results["full"])]
+    lines = ["%d files in %d albums" % (results["files"], results["albums"]),
+             "%-40s %10s %12s %14s %10s" % ("measurement", "seconds", "files/s", "syscalls/album", "vs base")]
+    baseline_rows = {}
+    if baseline is not None:
+        baseline_rows = dict([("discovery", baseline["discovery"])] + list(baseline["stages"].items()) + [("full", baseline["full"])])
+    for name, row in rows:
+        ratio = "-"
+        if name in baseline_rows and row["seconds"]:
+            ratio = "%.2fx" % (baseline_rows[name]["seconds"] / row["seconds"])
+        lines.append("%-40s %10.3f %12s %14s %10s" % (name, row["seconds"], _format_rate(row["files_per_second"]),
+                                                      _format_rate(row["syscalls_per_album"]), ratio))
+    return "\n".join(lines)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmarks the beautifier on a generated library.")
+    parser.add_argument("work_path", help = "directory for the generated library, e.g. on a tmpfs")
+    parser.add_argument("--albums", type = int, default = 200)
+    parser.add_argument("--tracks", type = int, default = 10)
+    parser.add_argument("--multi-cd-ratio", type = float, default = 0.2)
+    parser.add_argument("--scans-ratio", type = float, default = 0.5)
+    parser.add_argument("--image-ratio", type = float, default = 0.2)
+    parser.add_argument("--playlist-ratio", type = float, default = 0.5)
+    parser.add_argument("--collision-ratio", type = float, default = 0.3)
+    parser.add_argument("--file-size", type = int, default = 1024)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--jobs", type = int, default = 1)
+    parser.add_argument("--output", help = "write the results as JSON")
+    parser.add_argument("--compare", help = "JSON results of a previous run to compare against")
+    arguments = parser.parse_args(argv)
+
+    results = run_benchmark(Path(arguments.work_path), arguments.jobs, albums = arguments.albums, tracks = arguments.tracks,
+                            multi_cd_ratio = arguments.multi_cd_ratio, scans_ratio = arguments.scans_ratio,
+                            image_ratio = arguments.image_ratio, playlist_ratio = arguments.playlist_ratio,
+                            collision_ratio = arguments.collision_ratio, file_size = arguments.file_size, seed = arguments.seed)
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare, encoding = "utf-8") as file:
+            baseline = json.load(file)
+    print(format_results(results, baseline))
+    if arguments.output:
+        with open(arguments.output, "w", encoding = "utf-8") as file:
+            json.dump(results, file, indent = 1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Command line entry point. It is run once per ripped album from hooks, so every subcommand imports
+# what it needs only when it runs; "beautify <album>" never loads the watch, asyncio or process pool code.
+
+def _scan(arguments):
+    from main import discover_albums
+    shard = None
+    if arguments.shard:
+        from shard import Shard
+        shard = Shard.parse(arguments.shard)
+    state_cache = None
+    if arguments.incremental:
+        from state_cache import AlbumStateCache
+        state_cache = AlbumStateCache(arguments.library, shard = shard)
+    for album_path in discover_albums(arguments.library, state_cache, shard):
+        print(album_path)
+    return 0
+
+def _beautify(arguments):
+    from main import _beautify_album_folder_safely, iter_deepest_audio_folders, iter_album_plans
+    failed = False
+    for path in arguments.albums:
+        # A path may be an artist folder; every album in it is beautified.
+        album_paths = iter_deepest_audio_folders(path)
+        if arguments.dry_run:
+            for album_plan in iter_album_plans(album_paths):
+                if album_plan.operations:
+                    print(album_plan.describe())
+            continue
+        for album_path in album_paths:
+            print("Beautifying: " + str(album_path))
+            _, error = _beautify_album_folder_safely(album_path)
+            if error is not None:
+                print("Failed: " + str(album_path) + ": " + error)
+                failed = True
+    return 1 if failed else 0
+
+def _verify(arguments):
+    from main import is_canonical_album, iter_deepest_audio_folders
+    untidy = False
+    for path in arguments.albums:
+        for album_path in iter_deepest_audio_folders(path):
+            if not is_canonical_album(album_path):
+                print(album_path)
+                untidy = True
+    return 1 if untidy else 0
+
+def _plan(arguments):
+    from main import iter_album_plans, iter_deepest_audio_folders
+    album_plans = iter_album_plans(iter_deepest_audio_folders(arguments.library))
+    if arguments.output:
+        from plan import write_album_plans
+        write_album_plans(arguments.output, album_plans)
+    else:
+        for album_plan in album_plans:
+            if album_plan.operations:
+                print(album_plan.describe())
+    return 0
+
+def _apply(arguments):
+    from plan import apply_plan, read_album_plans
+    apply_plan(read_album_plans(arguments.plan_file))
+    return 0
+
+def _watch(arguments):
+    from watcher import watch
+    watch(arguments.library, arguments.settle_delay)
+    return 0
+
+def _merge(arguments):
+    import json
+    from shard import merge_manifests, read_manifest
+    merged = merge_manifests([read_manifest(path) for path in arguments.manifests])
+    if arguments.output:
+        with open(arguments.output, "w", encoding = "utf-8") as file:
+            json.dump(merged, file, ensure_ascii = False, indent = 1)
+    print("Beautified albums: " + str(merged["beautified_count"]))
+    for album_path, error in sorted(merged["errors"].items()):
+        print("Failed: " + album_path + ": " + error)
+    for index in merged["missing_shards"]:
+        print("Missing shard: " + str(index) + "/" + str(merged["count"]))
+    return 1 if merged["errors"] or merged["missing_shards"] else 0
+
+def _run(arguments):
+    import main
+    return main.main([str(arguments.library)] + arguments.options)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "beautifier", description = "Tidies up album folders of a music library.")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    scan_parser = subparsers.add_parser("scan", help = "list the album folders of a library")
+    scan_parser.add_argument("library", type = Path)
+    scan_parser.add_argument("--incremental", action = "store_true", help = "list only albums changed since they were last beautified")
+    scan_parser.add_argument("--shard", help = "list only the albums of shard i/N")
+    scan_parser.set_defaults(handler = _scan)
+
+    beautify_parser = subparsers.add_parser("beautify", help = "beautify single albums, e.g. right after ripping")
+    beautify_parser.add_argument("albums", type = Path, nargs = "+")
+    beautify_parser.add_argument("--dry-run", action = "store_true", help = "print the planned operations only")
+    beautify_parser.set_defaults(handler = _beautify)
+
+    verify_parser = subparsers.add_parser("verify", help = "list albums that are not tidy yet, without writing anything")
+    verify_parser.add_argument("albums", type = Path, nargs = "+")
+    verify_parser.set_defaults(handler = _verify)
+
+    plan_parser = subparsers.add_parser("plan", help = "plan a library without touching it")
+    plan_parser.add_argument("library", type = Path)
+    plan_parser.add_argument("--output", help = "write the plan as JSON instead of printing it")
+    plan_parser.set_defaults(handler = _plan)
+
+    apply_parser = subparsers.add_parser("apply", help = "apply a plan written by plan --output")
+    apply_parser.add_argument("plan_file")
+    apply_parser.set_defaults(handler = _apply)
+
+    watch_parser = subparsers.add_parser("watch", help = "beautify albums as they are copied into a library")
+    watch_parser.add_argument("library", type = Path)
+    watch_parser.add_argument("--settle-delay", type = float, default = 2.0, help = "seconds a folder must be quiet")
+    watch_parser.set_defaults(handler = _watch)
+
+    merge_parser = subparsers.add_parser("merge", help = "combine the manifests written by run --shard")
+    merge_parser.add_argument("manifests", nargs = "+")
+    merge_parser.add_argument("--output", help = "write the combined manifest to this file")
+    merge_parser.set_defaults(handler = _merge)
+
+    run_parser = subparsers.add_parser("run", help = "beautify a whole library; takes the options of main.py")
+    run_parser.add_argument("library", type = Path)
+    run_parser.add_argument("options", nargs = argparse.REMAINDER)
+    run_parser.set_defaults(handler = _run)
+
+    arguments = parser.parse_args(argv)
+    return arguments.handler(arguments)
+
+if __name__ == "__main__":
+    sys.exit(main())
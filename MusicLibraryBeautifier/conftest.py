@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from main import AlbumSnapshot
+
+_untidy_album = {"t1.flac": "t1", "t1.m3u": "t1.flac", "notes.txt": "notes", "scans/front.jpg": "front"}
+
+def _create_album(album_path: Path, files: dict = None, extra_files: dict = None):
+    # Writes {relative path: contents}, by default an untidy album: audio, a playlist, notes and a scans folder.
+    # Plain file calls, so it works on the fake filesystem and on a real temporary folder alike.
+    files = dict(_untidy_album if files is None else files, **(extra_files or {}))
+    for name, contents in files.items():
+        path = Path(album_path) / name
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text(contents)
+    return Path(album_path)
+
+def _count_listings(snapshot: AlbumSnapshot):
+    # Returns the list of folders the snapshot reads from disk from now on, in order.
+    listed_folders = []
+    entries = snapshot.entries
+    def counting_entries(folder):
+        if AlbumSnapshot._key(folder) not in snapshot._folders:
+            listed_folders.append(AlbumSnapshot._key(folder))
+        return entries(folder)
+    snapshot.entries = counting_entries
+    return listed_folders
+
+@pytest.fixture
+def create_album():
+    return _create_album
+
+@pytest.fixture
+def count_listings():
+    return _count_listings
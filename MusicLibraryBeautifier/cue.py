@@ -0,0 +1,141 @@
+import codecs
+import os
+import re
+from pathlib import Path
+
+import instrumentation
+from state_cache import JsonCache
+
+_cue_cache_file_name = ".beautifier_cues.json"
+_cue_cache_version = 1
+# Cue sheets are a few KiB; anything much bigger with a .cue extension is not read.
+_max_cue_size = 256 * 1024
+_boms = [(codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be")]
+# Cue sheets without a BOM that are not UTF-8 were written by rippers in the system code page. The first of
+# these under which the referenced files exist is taken; names are compared after decoding, so a wrong guess
+# only shows as a reference that does not resolve.
+_legacy_encodings = ["cp1251", "cp1252", "shift_jis", "gbk"]
+_file_pattern = re.compile(rb'(?im)^[ \t]*FILE[ \t]+(?:"([^"\r\n]*)"|(\S+))')
+
+class CueSheet:
+    # The FILE targets of a cue sheet, kept as UTF-8 bytes when the encoding is known and as the raw bytes
+    # otherwise, with the encodings they may be in.
+    __slots__ = ("targets", "encodings")
+
+    def __init__(self, targets = (), encodings = ("utf-8",)):
+        self.targets = list(targets)
+        self.encodings = list(encodings)
+
+    def to_json(self):
+        return {"targets": [target.decode("latin-1") for target in self.targets], "encodings": self.encodings}
+
+    @staticmethod
+    def from_json(record: dict):
+        return CueSheet([target.encode("latin-1") for target in record["targets"]], record["encodings"])
+
+    def target_names(self, names):
+        # The targets decoded with the first encoding under which all of them are among names,
+        # or under the first encoding that decodes them at all.
+        decoded = None
+        for encoding in self.encodings:
+            try:
+                targets = [target.decode(encoding) for target in self.targets]
+            except UnicodeDecodeError:
+                continue
+            if decoded is None:
+                decoded = targets
+            if all(resolve_target(target, names) is not None for target in targets):
+                return targets
+        return decoded or []
+
+def _base_name(target: bytes):
+    # Targets may carry a relative or absolute path from the ripping machine; only the name is kept.
+    return target.replace(b"\\", b"/").rsplit(b"/", 1)[-1]
+
+def parse_cue_sheet(data: bytes):
+    for bom, encoding in _boms:
+        if data.startswith(bom):
+            text = data[len(bom):].decode(encoding, "replace")
+            data = text.encode("utf-8")
+            encodings = ["utf-8"]
+            break
+    else:
+        try:
+            data.decode("utf-8")
+            encodings = ["utf-8"]
+        except UnicodeDecodeError:
+            encodings = _legacy_encodings
+    targets = [_base_name(quoted or bare) for quoted, bare in _file_pattern.findall(data)]
+    return CueSheet([target for target in targets if target], encodings)
+
+def resolve_target(target: str, names):
+    # The file a FILE line refers to: the name itself, the name in another case, or a file with the same
+    # base name, since images are often converted (e.g. "CDImage.wav" to "CDImage.flac") after ripping.
+    if target in names:
+        return target
+    lowered = target.lower()
+    stem = os.path.splitext(lowered)[0]
+    same_stem = None
+    for name in names:
+        if name.lower() == lowered:
+            return name
+        if same_stem is None and os.path.splitext(name.lower())[0] == stem:
+            same_stem = name
+    return same_stem
+
+def _stat_key(stat: os.stat_result):
+    return "%d:%d:%d" % (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+class CueCache(JsonCache):
+    # Parsed cue sheets keyed by (device, inode, mtime), so a cue sheet is read once and keeps its entry
+    # when the album is moved or renamed.
+    version = _cue_cache_version
+
+    def __init__(self, file_path: Path = None):
+        self._sheets = {}
+        super().__init__(file_path)
+
+    def __len__(self):
+        return len(self._sheets)
+
+    def _load_fields(self, fields: dict):
+        self._sheets = {key: CueSheet.from_json(record) for key, record in fields.get("sheets", {}).items()}
+
+    def _fields(self):
+        return {"sheets": {key: sheet.to_json() for key, sheet in self._sheets.items()}}
+
+    def cue_sheet(self, path: Path):
+        # None when the file cannot be read.
+        try:
+            instrumentation.count("stat")
+            key = _stat_key(os.stat(path))
+        except OSError:
+            return None
+        sheet = self._sheets.get(key)
+        if sheet is None:
+            instrumentation.count("cue_read")
+            try:
+                with open(path, "rb") as file:
+                    data = file.read(_max_cue_size + 1)
+            except OSError:
+                return None
+            sheet = parse_cue_sheet(data) if len(data) <= _max_cue_size else CueSheet()
+            self._sheets[key] = sheet
+            self._changed = True
+        return sheet
+
+def library_cue_cache(library_path: Path, shard = None):
+    file_name = _cue_cache_file_name if shard is None else shard.file_name(_cue_cache_file_name)
+    return CueCache(Path(os.path.abspath(library_path)) / file_name)
+
+_cache = CueCache()
+
+def cache():
+    return _cache
+
+def configure(cue_cache: CueCache):
+    global _cache
+    _cache = cue_cache
+
+def cue_sheet(path: Path):
+    return _cache.cue_sheet(path)
@@ -0,0 +1,105 @@
+import os
+from pathlib import Path
+
+import instrumentation
+import mover
+from state_cache import JsonCache
+
+_hash_cache_file_name = ".beautifier_hashes.json"
+_hash_cache_version = 1
+
+def _stat_key(stat: os.stat_result):
+    return "%d:%d:%d:%d" % (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+class HashCache(JsonCache):
+    # Content hashes keyed by (device, inode, size, mtime) instead of by path: a file keeps its hash
+    # when it is moved or renamed within the library and is only read again once it changes.
+    version = _hash_cache_version
+
+    def __init__(self, file_path: Path = None):
+        self._hashes = {}
+        super().__init__(file_path)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _load_fields(self, fields: dict):
+        self._hashes = fields.get("hashes", {})
+
+    def _fields(self):
+        return {"hashes": self._hashes}
+
+    def file_hash(self, path: Path, stat: os.stat_result):
+        key = _stat_key(stat)
+        digest = self._hashes.get(key)
+        if digest is None:
+            instrumentation.count("bytes_hashed", stat.st_size)
+            digest = mover.file_hash(path)
+            self._hashes[key] = digest
+            self._changed = True
+        return digest
+
+def library_hash_cache(library_path: Path, shard = None):
+    file_name = _hash_cache_file_name if shard is None else shard.file_name(_hash_cache_file_name)
+    return HashCache(Path(os.path.abspath(library_path)) / file_name)
+
+def _kept_first(path: Path):
+    # The shallowest copy with the shortest name is kept: "cover.jpg" rather than "Scans/cover (1).jpg".
+    return (len(path.parts), len(path.name), path.name)
+
+def duplicate_groups(paths, hash_cache: HashCache):
+    # Files can only be identical if their sizes are, so only sizes shared by several files are hashed.
+    # Hard links of one file are a single candidate: they take no extra space.
+    by_size = {}
+    for path in paths:
+        instrumentation.count("stat")
+        stat = os.stat(path)
+        by_size.setdefault(stat.st_size, {}).setdefault((stat.st_dev, stat.st_ino), (path, stat))
+    groups = []
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        by_hash = {}
+        for path, stat in candidates.values():
+            by_hash.setdefault(hash_cache.file_hash(path, stat), []).append(path)
+        groups.extend(sorted(group, key = _kept_first) for group in by_hash.values() if len(group) > 1)
+    return groups
+
+class Deduplicator:
+    # Drops byte-identical files, or replaces them with hard links to the copy kept. A duplicate that ends up
+    # in the same folder as the copy kept is dropped either way: a link there would only be a renamed second copy.
+    # Albums are deduplicated before anything is moved, so the paths hashed are on disk even while planning.
+    def __init__(self, hash_cache: HashCache = None, hard_link: bool = False):
+        self.hash_cache = HashCache() if hash_cache is None else hash_cache
+        self.hard_link = hard_link
+
+    def deduplicate_folder(self, folder: Path, snapshot):
+        return self.deduplicate([path for path in snapshot.iterdir(folder) if snapshot.is_file(path)], snapshot)
+
+    def deduplicate(self, files, snapshot, destination = None):
+        # destination tells the folder a file ends up in once the album is beautified; by default the one it is in.
+        if destination is None:
+            destination = lambda path: path.parent
+        duplicates = 0
+        for group in duplicate_groups(files, self.hash_cache):
+            for duplicate in group[1:]:
+                if self.hard_link and destination(duplicate) != destination(group[0]):
+                    snapshot.link(group[0], duplicate)
+                else:
+                    snapshot.unlink(duplicate)
+                duplicates += 1
+        return duplicates
+
+_deduplicator = None
+
+def deduplicator():
+    return _deduplicator
+
+def configure(**options):
+    global _deduplicator
+    _deduplicator = Deduplicator(**options)
+    return _deduplicator
+
+def disable():
+    global _deduplicator
+    _deduplicator = None
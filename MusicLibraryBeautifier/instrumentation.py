@@ -0,0 +1,209 @@
+import heapq
+import json
+import sys
+import threading
+import time
+
+# Instrumentation is off unless a Recorder is enabled; the module level helpers then do
+# nothing but a global lookup, so the beautifier can call them unconditionally.
+_recorder = None
+# Without a recorder, events still reach the progress sink, e.g. for the console's "Beautifying: ..." lines.
+_progress = None
+_album_end_events = ("album_finished", "album_failed")
+
+class Totals:
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.counters = {}
+
+    def add(self, seconds: float, counters: dict):
+        self.seconds += seconds
+        self.calls += 1
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_json(self):
+        return {"seconds": self.seconds, "calls": self.calls, "counters": dict(self.counters)}
+
+class ConsoleSink:
+    def __init__(self, stream = None):
+        self.stream = stream
+
+    def __call__(self, event: dict):
+        stream = self.stream or sys.stdout
+        if event["event"] == "album_started":
+            print("Beautifying: " + event["album"], file = stream)
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding = "utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        with self._lock:
+            self._file.write(json.dumps(event, ensure_ascii = False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+class Recorder:
+    # Per-album totals are kept only while an album is in progress; finished albums leave just their time
+    # behind, and only the slowest_albums slowest of them, so memory does not grow with the library.
+    def __init__(self, sinks = (), slowest_albums: int = 10):
+        self.sinks = list(sinks)
+        self.stage_totals = {}
+        self.album_totals = {}
+        self.slowest_albums = slowest_albums
+        self._slowest = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _active_counters(self):
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            return None
+        return stack[-1]
+
+    def count(self, name: str, amount: int):
+        counters = self._active_counters()
+        if counters is None:
+            with self._lock:
+                self.stage_totals.setdefault("other", Totals()).add(0.0, {name: amount})
+            return
+        counters[name] = counters.get(name, 0) + amount
+
+    def push(self):
+        counters = {}
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(counters)
+        return counters
+
+    def pop(self, name: str, album, seconds: float):
+        counters = self._local.stack.pop()
+        with self._lock:
+            self.stage_totals.setdefault(name, Totals()).add(seconds, counters)
+            if album is not None:
+                album = str(album)
+                # A thread runs the stages of one album after another, so the album it ran before is done,
+                # even on paths that send no album_finished event, like planning.
+                previous = getattr(self._local, "album", None)
+                if previous is not None and previous != album:
+                    self._finish_album(previous)
+                self._local.album = album
+                self.album_totals.setdefault(album, Totals()).add(seconds, counters)
+        fields = {"stage": name, "seconds": seconds, "counters": counters}
+        if album is not None:
+            fields["album"] = str(album)
+        self.emit("stage_finished", fields)
+
+    def _finish_album(self, album: str):
+        totals = self.album_totals.pop(album, None)
+        if totals is None:
+            return
+        if len(self._slowest) < self.slowest_albums:
+            heapq.heappush(self._slowest, (totals.seconds, album))
+        else:
+            heapq.heappushpop(self._slowest, (totals.seconds, album))
+
+    def emit(self, kind: str, fields: dict):
+        event = {"event": kind, "time": time.time()}
+        event.update(fields)
+        if kind in _album_end_events:
+            with self._lock:
+                self._finish_album(str(fields["album"]))
+        for sink in self.sinks:
+            sink(event)
+
+    def slowest(self):
+        # (album, seconds) of the slowest albums, finished or still in progress, slowest first.
+        with self._lock:
+            albums = self._slowest + [(totals.seconds, album) for album, totals in self.album_totals.items()]
+        return [(album, seconds) for seconds, album in sorted(albums, reverse = True)[:self.slowest_albums]]
+
+    def summary(self):
+        lines = ["%-40s %8s %10s  %s" % ("stage", "calls", "seconds", "counters")]
+        for name, totals in sorted(self.stage_totals.items(), key = lambda item: -item[1].seconds):
+            counters = " ".join(key + "=" + str(value) for key, value in sorted(totals.counters.items()))
+            lines.append("%-40s %8d %10.3f  %s" % (name, totals.calls, totals.seconds, counters))
+        slowest = self.slowest()
+        if slowest:
+            lines.append("")
+            lines.append("slowest albums:")
+            for album, seconds in slowest:
+                lines.append("%10.3f  %s" % (seconds, album))
+        return "\n".join(lines)
+
+class _Stage:
+    __slots__ = ("_recorder", "_name", "_album", "_start")
+
+    def __init__(self, recorder: Recorder, name: str, album):
+        self._recorder = recorder
+        self._name = name
+        self._album = album
+
+    def __enter__(self):
+        self._recorder.push()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self._recorder.pop(self._name, self._album, time.perf_counter() - self._start)
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+_null_stage = _NullStage()
+
+def enable(recorder: Recorder):
+    global _recorder
+    _recorder = recorder
+    return recorder
+
+def disable():
+    global _recorder, _progress
+    _recorder = None
+    _progress = None
+
+def show_progress(sink):
+    global _progress
+    _progress = sink
+
+def recorder():
+    return _recorder
+
+def stage(name: str, album = None):
+    if _recorder is None:
+        return _null_stage
+    return _Stage(_recorder, name, album)
+
+def count(name: str, amount: int = 1):
+    if _recorder is not None:
+        _recorder.count(name, amount)
+
+def event(kind: str, **fields):
+    if _recorder is not None:
+        _recorder.emit(kind, fields)
+    elif _progress is not None:
+        fields["event"] = kind
+        _progress(fields)
+
+def timed_iter(name: str, iterable):
+    # Attributes the time spent producing items (e.g. the discovery walk) to its own stage,
+    # excluding whatever the consumer does between items.
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import instrumentation
+from plan import Operation, AlbumPlan, PlanApplier
+
+_journal_file_name = ".beautifier_journal.jsonl"
+_default_sync_interval = 64
+
+def is_applied(operation: Operation):
+    # Tells whether an operation of an interrupted album already took effect, so replaying is idempotent.
+    # A move interrupted between devices still has its source and is resumed by the move engine.
+    if operation.kind == Operation.MKDIR:
+        return os.path.isdir(operation.source)
+    # Sources existed when the album was planned, so a missing one was moved or removed by the plan itself,
+    # possibly by a later operation.
+    if operation.kind in (Operation.RENAME, Operation.MOVE, Operation.UNLINK, Operation.RMDIR):
+        return not os.path.lexists(operation.source)
+    if operation.kind == Operation.LINK:
+        if not os.path.lexists(operation.source) or not os.path.lexists(operation.target):
+            return True
+        return os.path.samefile(operation.source, operation.target)
+    raise ValueError("Unknown operation: " + operation.kind)
+
+class Journal:
+    # Append-only write-ahead log of album plans. A plan is synced to disk before its first operation runs;
+    # progress and completion records are synced in batches, since losing them only means that a few
+    # operations are checked with is_applied again on resume.
+    def __init__(self, path: Path, sync_interval: int = _default_sync_interval):
+        self.path = Path(path)
+        self.sync_interval = sync_interval
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._finished = set()
+        self._incomplete = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            # The tail of a record that was being written when the run was killed. It is cut off,
+            # so that the records of this run start on a line of their own.
+            with open(self.path, "r+b") as file:
+                file.truncate(complete)
+        for line in data[:complete].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            album = record["album"]
+            if "operations" in record:
+                self._incomplete[album] = [AlbumPlan(album, [Operation.from_json(operation) for operation in record["operations"]]), 0]
+            elif "applied" in record and album in self._incomplete:
+                self._incomplete[album][1] = record["applied"]
+            elif record.get("finished"):
+                self._incomplete.pop(album, None)
+                self._finished.add(album)
+
+    def incomplete_albums(self):
+        return [plan for plan, _ in self._incomplete.values()]
+
+    def is_finished(self, album_path: Path):
+        return os.path.abspath(album_path) in self._finished
+
+    def _append(self, record: dict, sync: bool):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding = "utf-8", newline = "\n")
+            self._file.write(json.dumps(record, ensure_ascii = False) + "\n")
+            self._unsynced += 1
+            if sync or self._unsynced >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        instrumentation.count("fsync")
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def begin(self, plan: AlbumPlan):
+        self._append({"album": str(plan.path), "operations": [operation.to_json() for operation in plan.operations]}, True)
+
+    def applied(self, plan: AlbumPlan, count: int):
+        self._append({"album": str(plan.path), "applied": count}, False)
+
+    def finish(self, plan: AlbumPlan):
+        self._append({"album": str(plan.path), "finished": True}, False)
+        with self._lock:
+            self._incomplete.pop(str(plan.path), None)
+            self._finished.add(str(plan.path))
+
+    def apply_album(self, plan: AlbumPlan, applier: PlanApplier, applied: int = None):
+        # applied is None for a new album, or the number of operations recorded as done for a resumed one.
+        if plan.operations:
+            if applied is None:
+                self.begin(plan)
+            for index in range(applied or 0, len(plan.operations)):
+                operation = plan.operations[index]
+                if applied is None or not is_applied(operation):
+                    applier.apply_operation(operation)
+                self.applied(plan, index + 1)
+        self.finish(plan)
+
+    def resume(self, applier: PlanApplier = None):
+        # Rolls interrupted albums forward: operations recorded as applied are skipped, the rest are
+        # checked and applied. Folders stranded under the temporary name are renamed by their replayed plan.
+        applier = PlanApplier() if applier is None else applier
+        resumed = []
+        for plan, applied in list(self._incomplete.values()):
+            instrumentation.event("album_resumed", album = str(plan.path), applied = applied)
+            self.apply_album(plan, applier, applied)
+            resumed.append(plan.path)
+        return resumed
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        # After a complete run nothing is left to resume.
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+def library_journal(library_path: Path, shard = None):
+    file_name = _journal_file_name if shard is None else shard.file_name(_journal_file_name)
+    return Journal(Path(os.path.abspath(library_path)) / file_name)
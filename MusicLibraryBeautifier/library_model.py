@@ -0,0 +1,124 @@
+import os
+import sys
+from array import array
+from pathlib import Path
+
+import instrumentation
+from main import AlbumSnapshot, SnapshotEntry, FileKind, FolderDiscovery, file_kind, is_disc_folder_name, _beautify_album_stages
+from plan import AlbumPlan
+
+_unknown = -1
+
+class DirectoryNode:
+    # One folder of a whole-library view. Folder names are interned, the names of the files are kept in one
+    # "\0" separated string and their kinds, sizes and mtimes in typed arrays, so a file costs its name plus
+    # about 17 bytes instead of a Path and a stat result. Full paths are only built on demand.
+    __slots__ = ("name", "parent", "directories", "_file_names", "file_kinds", "file_sizes", "file_mtimes")
+
+    def __init__(self, name: str, parent = None):
+        self.name = sys.intern(name)
+        self.parent = parent
+        self.directories = []
+        self._file_names = ""
+        self.file_kinds = array("b")
+        self.file_sizes = array("q")
+        self.file_mtimes = array("q")
+
+    def set_files(self, names, kinds, sizes, mtimes):
+        self._file_names = "\0".join(names)
+        self.file_kinds = array("b", kinds)
+        self.file_sizes = array("q", sizes)
+        self.file_mtimes = array("q", mtimes)
+
+    def file_names(self):
+        return self._file_names.split("\0") if self._file_names else []
+
+    def file_count(self):
+        return len(self.file_kinds)
+
+    def path(self):
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return Path(*reversed(names))
+
+    def iter_nodes(self):
+        # The node and all folders below it, parents first.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.directories))
+
+def scan_library(path: Path, with_stats: bool = True):
+    # Lists the library once; without stats sizes and mtimes are unknown (-1) but no file is stat'ed.
+    root = DirectoryNode(os.path.abspath(path))
+    _scan_folder(root, with_stats)
+    return root
+
+def _scan_folder(node: DirectoryNode, with_stats: bool):
+    instrumentation.count("listdir")
+    try:
+        with os.scandir(node.path()) as iterator:
+            entries = list(iterator)
+    except OSError:
+        return
+    names = []
+    kinds = []
+    sizes = []
+    mtimes = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks = False):
+            node.directories.append(DirectoryNode(entry.name, node))
+            continue
+        names.append(entry.name)
+        kinds.append(file_kind(entry.name))
+        if with_stats:
+            instrumentation.count("stat")
+            stat = entry.stat(follow_symlinks = False)
+            sizes.append(stat.st_size)
+            mtimes.append(stat.st_mtime_ns)
+        else:
+            sizes.append(_unknown)
+            mtimes.append(_unknown)
+    node.set_files(names, kinds, sizes, mtimes)
+    for directory in node.directories:
+        _scan_folder(directory, with_stats)
+
+def _album_nodes(node: DirectoryNode):
+    # The rules of main.iter_deepest_audio_folders, applied to the model.
+    albums = []
+    discovery = FolderDiscovery(node, FileKind.AUDIO in node.file_kinds)
+    for directory in node.directories:
+        child_albums, has_audio = _album_nodes(directory)
+        if is_disc_folder_name(directory.name):
+            discovery.add_child(directory, child_albums, has_audio)
+        else:
+            albums.extend(child_albums)
+            discovery.add_child(directory, None, has_audio)
+    return albums + discovery.albums(), discovery.has_audio()
+
+def iter_album_nodes(root: DirectoryNode):
+    yield from _album_nodes(root)[0]
+
+def album_snapshot(node: DirectoryNode, plan: AlbumPlan = None):
+    # An AlbumSnapshot whose listings come from the model, so the stages run without listing the album again.
+    snapshot = AlbumSnapshot(node.path(), plan)
+    for folder in node.iter_nodes():
+        entries = {directory.name: SnapshotEntry(True) for directory in folder.directories}
+        for name, size in zip(folder.file_names(), folder.file_sizes):
+            entries[name] = SnapshotEntry(False, None if size == _unknown else size)
+        snapshot.prime(folder.path(), entries)
+    return snapshot
+
+def plan_album_node(node: DirectoryNode):
+    plan = AlbumPlan(node.path())
+    snapshot = album_snapshot(node, plan)
+    _beautify_album_stages(snapshot.path, snapshot)
+    return plan
+
+def iter_album_plans(root: DirectoryNode):
+    for node in iter_album_nodes(root):
+        yield plan_album_node(node)
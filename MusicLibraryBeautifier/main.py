@@ -1,58 +1,366 @@
 import sys
-import mimetypes
-import shutil
 import os
 import re
-import uuid
+from enum import IntEnum
+from functools import lru_cache
 from pathlib import Path
+from plan import Operation, AlbumPlan, LibraryPlan, PlanApplier, apply_plan, read_album_plans, write_album_plans, _paths_overlap
+from journal import Journal, library_journal
+from state_cache import AlbumStateCache, is_tool_file
+import instrumentation
+import mover
+import dedup
+import cue
 
 _m3u_regex = r"(?i)\.m3u8?$"
+_disc_folder_pattern = re.compile(r"(?i)^\s*[\[(]?\s*(?:cd|disc|disk)\s*0*(\d{1,2})\s*[\])]?\s*$")
 _audio_extensions_not_in_mime = [".ape", ".wv", ".ac3", ".caf", ".m4b", ".tta", ".voc", ".wma"]
+_audio_extensions = [".mp3", ".mp2", ".flac", ".ogg", ".oga", ".opus", ".wav", ".aif", ".aiff", ".aac", ".m4a",
+                     ".mpc", ".mka", ".dsf", ".dff", ".au", ".snd", ".mid", ".midi"] + _audio_extensions_not_in_mime
+_image_extensions = [".jpg", ".jpeg", ".jpe", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".ico", ".svg"]
+_playlist_extensions = [".m3u", ".m3u8", ".pls"]
+_playlist_mimes = ["audio/x-mpegurl", "audio/mpegurl", "application/vnd.apple.mpegurl", "audio/x-scpls"]
 _cue_extension = ".cue"
 _log_extension = ".log"
 _temp_folder_suffix = "as140izeowq34"
 _maximum_item_suffix = 100
+_queued_albums_per_job = 2
+
+class FileKind(IntEnum):
+    OTHER = 0
+    AUDIO = 1
+    IMAGE = 2
+    CUE = 3
+    LOG = 4
+    PLAYLIST = 5
+
+# Extensions met in almost every album that are neither audio nor images. With them in the table a typical
+# album is classified without loading the system MIME databases, which costs more than beautifying it.
+_other_extensions = [".txt", ".nfo", ".pdf", ".accurip", ".md5", ".sfv", ".ffp", ".st5", ".sha1", ".url", ".htm", ".html",
+                     ".rtf", ".doc", ".docx", ".xml", ".json", ".ini", ".db", ".ds_store", ".toc"]
+
+_file_kinds = {_cue_extension: FileKind.CUE, _log_extension: FileKind.LOG}
+_file_kinds.update((extension, FileKind.OTHER) for extension in _other_extensions)
+_file_kinds.update((extension, FileKind.AUDIO) for extension in _audio_extensions)
+_file_kinds.update((extension, FileKind.IMAGE) for extension in _image_extensions)
+_file_kinds.update((extension, FileKind.PLAYLIST) for extension in _playlist_extensions)
+# Kinds whose arrival in a folder can change which of its files belong to an audio image.
+_audio_image_kinds = (FileKind.AUDIO, FileKind.CUE, FileKind.LOG)
+
+@lru_cache(maxsize = 1024)
+def _file_kind_from_mime(extension: str):
+    import mimetypes
+    mime, _ = mimetypes.guess_type("file" + extension, strict = False)
+    if mime is None:
+        return FileKind.OTHER
+    if mime in _playlist_mimes:
+        return FileKind.PLAYLIST
+    if mime.startswith("audio/"):
+        return FileKind.AUDIO
+    if mime.startswith("image/"):
+        return FileKind.IMAGE
+    return FileKind.OTHER
+
+def file_kind(path: Path):
+    _, extension = os.path.splitext(path)
+    if not extension:
+        return FileKind.OTHER
+    extension = extension.lower()
+    kind = _file_kinds.get(extension)
+    if kind is None:
+        kind = _file_kind_from_mime(extension)
+    return kind
 
 def is_audio_file(path: Path):
-     mime, _ = mimetypes.guess_type(path)
-     m3u_pattern = re.compile(_m3u_regex)
-     if mime and mime.startswith("audio/") and not m3u_pattern.search(path.name):
-         return True
-     return path.suffix in _audio_extensions_not_in_mime
+    return file_kind(path) == FileKind.AUDIO
 
 def is_image_file(path: Path):
-    mime, _ = mimetypes.guess_type(path)
-    return mime is not None and mime.startswith("image/")
+    return file_kind(path) == FileKind.IMAGE
 
 def is_cue_file(path: Path):
-    return (path.suffix == ".cue")
+    return file_kind(path) == FileKind.CUE
 
 def is_log_file(path: Path):
-    return (path.suffix == ".log")
-
-def is_audio_image_file(path: Path):
-    parent = path.parent
-    filename, _ = os.path.splitext(path)
-    if is_audio_file(path):
-        return (parent / (filename + _cue_extension)).exists() or (parent / (filename + _log_extension)).exists()
-    extension = path.suffix
-    if extension == _cue_extension:
-        for item in parent.glob("*"):
-            item_filename, _ = os.path.splitext(item)
-            if item_filename == filename and is_audio_file(item):
-                return True
-    if extension == _log_extension:
-        for item in parent.glob("*"):
-            item_filename, _ = os.path.splitext(item)
-            if item_filename == filename and is_audio_file(item):
-                return True
-    return False
-
-def is_misc_file(path: Path, is_audio_image_album: bool):
+    return file_kind(path) == FileKind.LOG
+
+def is_playlist_file(path: Path):
+    return file_kind(path) == FileKind.PLAYLIST
+
+class SnapshotEntry:
+    def __init__(self, is_dir: bool, size = None):
+        self.is_dir = is_dir
+        self.size = size
+
+def _stem(name: str):
+    filename, _ = os.path.splitext(name)
+    return filename.lower()
+
+class StemIndex:
+    # Maps the base name of every file in a folder to its files by kind,
+    # e.g. "album" -> {AUDIO: ["Album.flac"], CUE: ["Album.cue"], LOG: ["Album.log"]} for a single-file image rip.
+    def __init__(self, names = ()):
+        self._names = {}
+        for name in names:
+            self._names.setdefault(_stem(name), {}).setdefault(file_kind(name), []).append(name)
+
+    def kinds(self, stem: str):
+        return set(self._names.get(stem.lower(), ()))
+
+    def kinds_of(self, name: str):
+        return self.kinds(_stem(name))
+
+    def names(self, stem: str, kind: FileKind):
+        return list(self._names.get(stem.lower(), {}).get(kind, ()))
+
+class AlbumSnapshot:
+    # In-memory listing of an album. Every folder is listed from disk at most once, on first use,
+    # and the stages keep the listings up to date through the record_* methods as they move files.
+    # When a plan is given, the operations are recorded into it instead of being executed,
+    # so the stages see the planned layout without anything being touched on disk.
+    def __init__(self, path: Path, plan: AlbumPlan = None):
+        self.path = self._key(path)
+        self.plan = plan
+        self._folders = {}
+        self._stem_indexes = {}
+        self._audio_image_names = {}
+        self._next_suffixes = {}
+
+    @staticmethod
+    def _key(path):
+        return Path(os.path.abspath(path))
+
+    def entries(self, folder: Path):
+        folder = self._key(folder)
+        entries = self._folders.get(folder)
+        if entries is None:
+            entries = {}
+            instrumentation.count("listdir")
+            try:
+                with os.scandir(folder) as iterator:
+                    for entry in iterator:
+                        entries[entry.name] = SnapshotEntry(entry.is_dir(follow_symlinks = False))
+            except OSError:
+                pass
+            self._folders[folder] = entries
+        return entries
+
+    def prime(self, folder: Path, entries: dict):
+        # A listing obtained elsewhere, e.g. from the library model, so the folder is not read from disk.
+        self._folders[self._key(folder)] = entries
+
+    def stem_index(self, folder: Path):
+        # Built from the folder's listing on first use, and again only after a file was added or removed.
+        folder = self._key(folder)
+        index = self._stem_indexes.get(folder)
+        if index is None:
+            index = StemIndex(name for name, entry in self.entries(folder).items() if not entry.is_dir)
+            self._stem_indexes[folder] = index
+        return index
+
+    def audio_image_names(self, folder: Path):
+        # Worked out once per folder, and again only after a file that may change the pairing was added or removed.
+        folder = self._key(folder)
+        names = self._audio_image_names.get(folder)
+        if names is None:
+            names = audio_image_names(folder, [name for name, entry in self.entries(folder).items() if not entry.is_dir],
+                                      self.stem_index(folder))
+            self._audio_image_names[folder] = names
+        return names
+
+    def entry(self, path: Path):
+        path = self._key(path)
+        return self.entries(path.parent).get(path.name)
+
+    def exists(self, path: Path):
+        return self.entry(path) is not None
+
+    def is_file(self, path: Path):
+        entry = self.entry(path)
+        return entry is not None and not entry.is_dir
+
+    def is_dir(self, path: Path):
+        entry = self.entry(path)
+        return entry is not None and entry.is_dir
+
+    def size(self, path: Path):
+        entry = self.entry(path)
+        if entry is None:
+            return None
+        if entry.size is None:
+            instrumentation.count("stat")
+            entry.size = os.stat(path, follow_symlinks = False).st_size
+        return entry.size
+
+    def iterdir(self, folder: Path):
+        folder = self._key(folder)
+        return [folder / name for name in list(self.entries(folder))]
+
+    def rglob(self, folder: Path):
+        for path in self.iterdir(folder):
+            entry = self.entry(path)
+            if entry is None:
+                continue
+            yield path
+            if entry.is_dir:
+                yield from self.rglob(path)
+
+    def _add_entry(self, path: Path, entry: SnapshotEntry):
+        if path.parent not in self._folders:
+            return
+        self._folders[path.parent][path.name] = entry
+        if not entry.is_dir:
+            self._stem_indexes.pop(path.parent, None)
+        if not entry.is_dir and file_kind(path.name) in _audio_image_kinds:
+            self._audio_image_names.pop(path.parent, None)
+
+    def _pop_entry(self, path: Path):
+        entry = self.entries(path.parent).pop(path.name, None)
+        if entry is not None and not entry.is_dir:
+            self._stem_indexes.pop(path.parent, None)
+        if entry is not None and path.name in self._audio_image_names.get(path.parent, ()):
+            self._audio_image_names.pop(path.parent)
+        return entry
+
+    def _cached_subtree(self, path: Path):
+        return [folder for folder in self._folders if folder == path or path in folder.parents]
+
+    def record_created(self, path: Path, is_dir: bool):
+        path = self._key(path)
+        self._add_entry(path, SnapshotEntry(is_dir))
+
+    def record_moved(self, source_path: Path, target_path: Path):
+        source_path = self._key(source_path)
+        target_path = self._key(target_path)
+        entry = self._pop_entry(source_path)
+        if entry is None:
+            return
+        self._add_entry(target_path, entry)
+        if entry.is_dir:
+            for folder in self._cached_subtree(source_path):
+                moved_folder = target_path / folder.relative_to(source_path)
+                self._folders[moved_folder] = self._folders.pop(folder)
+                self._stem_indexes.pop(folder, None)
+                if folder in self._audio_image_names:
+                    self._audio_image_names[moved_folder] = self._audio_image_names.pop(folder)
+
+    def record_removed(self, path: Path):
+        path = self._key(path)
+        self._pop_entry(path)
+        self.refresh(path)
+
+    def refresh(self, folder: Path):
+        folder = self._key(folder)
+        for cached_folder in self._cached_subtree(folder):
+            del self._folders[cached_folder]
+            self._stem_indexes.pop(cached_folder, None)
+            self._audio_image_names.pop(cached_folder, None)
+
+    def mkdir(self, path: Path):
+        if self.plan is None:
+            instrumentation.count("mkdir")
+            path.mkdir(parents = True, exist_ok = True)
+        else:
+            self.plan.add(Operation.MKDIR, self._key(path))
+            self._folders.setdefault(self._key(path), {})
+        self.record_created(path, True)
+
+    def move(self, source_path: Path, target_path: Path, kind: str = Operation.MOVE):
+        # Both listings are loaded before the move so that neither of them is read half-updated from disk.
+        self.entries(source_path.parent)
+        self.entries(target_path.parent)
+        if self.plan is None:
+            if kind == Operation.RENAME:
+                instrumentation.count("rename")
+                os.rename(source_path, target_path)
+            else:
+                mover.default_engine().move(source_path, target_path)
+        else:
+            if self.is_dir(source_path):
+                # The planned folder only exists in memory from now on, so its subtree must be listed first.
+                for _ in self.rglob(source_path):
+                    pass
+            self.plan.add(kind, self._key(source_path), self._key(target_path))
+        self.record_moved(source_path, target_path)
+
+    def rename(self, source_path: Path, target_path: Path):
+        self.move(source_path, target_path, Operation.RENAME)
+
+    def unlink(self, path: Path):
+        if self.plan is None:
+            instrumentation.count("unlink")
+            path.unlink()
+        else:
+            self.plan.add(Operation.UNLINK, self._key(path))
+        self.record_removed(path)
+
+    def link(self, source_path: Path, target_path: Path):
+        # The target stays a file of the same size, so the listings do not change.
+        if self.plan is None:
+            instrumentation.count("link")
+            mover.link_file(source_path, target_path)
+        else:
+            self.plan.add(Operation.LINK, self._key(source_path), self._key(target_path))
+
+    def rmdir(self, path: Path):
+        if self.plan is None:
+            instrumentation.count("rmdir")
+            path.rmdir()
+            mover.default_engine().forget(self._key(path))
+        else:
+            self.plan.add(Operation.RMDIR, self._key(path))
+        self.record_removed(path)
+
+def audio_image_names(folder: Path, names, stem_index: StemIndex = None):
+    # The files of a folder that make up audio images: every cue sheet with the audio file its FILE lines
+    # refer to, and rip logs named after either of them or after an audio file. An image is a single audio file,
+    # so a cue sheet whose references match several audio files (one file per track) or none, or that cannot
+    # be read, is paired by base name instead.
+    index = StemIndex(names) if stem_index is None else stem_index
+    audio_names = [name for name in names if file_kind(name) == FileKind.AUDIO]
+    members = set()
+    for name in names:
+        if file_kind(name) != FileKind.CUE:
+            continue
+        paired = []
+        sheet = cue.cue_sheet(folder / name)
+        if sheet is not None:
+            for target in sheet.target_names(audio_names):
+                audio_name = cue.resolve_target(target, audio_names)
+                if audio_name is not None and audio_name not in paired:
+                    paired.append(audio_name)
+        if len(paired) != 1:
+            paired = index.names(_stem(name), FileKind.AUDIO)
+        if paired:
+            members.add(name)
+            members.update(paired)
+    member_stems = {_stem(name) for name in members}
+    for name in names:
+        if file_kind(name) == FileKind.LOG:
+            stem = _stem(name)
+            same_stem_audio = index.names(stem, FileKind.AUDIO)
+            if stem in member_stems or same_stem_audio:
+                members.add(name)
+                members.update(same_stem_audio)
+    return members
+
+def is_audio_image_file(path: Path, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(path.parent)
+    return path.name in snapshot.audio_image_names(path.parent)
+
+def is_audio_image_album(path: Path, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(path)
+    return bool(snapshot.audio_image_names(path))
+
+def is_misc_file(path: Path, is_audio_image_album: bool, snapshot: AlbumSnapshot = None):
+    # is_audio_image_album is worked out once per folder by the caller, with is_audio_image_album(), and a
+    # snapshot passed in keeps the folder's pairing, so neither lists the folder again for every file.
+    if snapshot is None:
+        snapshot = AlbumSnapshot(path.parent)
     if is_audio_image_album:
-        return not is_audio_file(path)
-    else:
-        return not is_audio_image_file(path)
+        return not is_audio_file(path) and not is_audio_image_file(path, snapshot)
+    return not is_audio_file(path)
 
 def is_deepest_audio_folder(path: Path):
     if path.is_file():
@@ -69,6 +377,110 @@ def is_deepest_audio_folder(path: Path):
 
     return has_audio_file
 
+def disc_number(folder_name: str):
+    # "CD1", "Disc 2", "[CD 3]", "disk04" -> the disc number; None for any other name.
+    match = _disc_folder_pattern.match(folder_name)
+    return None if match is None else int(match.group(1))
+
+def is_disc_folder_name(folder_name: str):
+    return disc_number(folder_name) is not None
+
+class FolderDiscovery:
+    # The discovery rules for one folder, fed with what was found below it: an album is a folder with audio
+    # files and no audio below it, or the folder holding the discs of a multi-disc set. Shared by the scandir
+    # walk and the library model; folder is a Path or a model node.
+    __slots__ = ("folder", "has_audio_file", "has_audio_descendant", "has_other_audio", "discs", "held")
+
+    def __init__(self, folder, has_audio_file: bool = False):
+        self.folder = folder
+        self.has_audio_file = has_audio_file
+        self.has_audio_descendant = False
+        self.has_other_audio = False
+        self.discs = []
+        self.held = []
+
+    def add_child(self, child, albums, has_audio: bool):
+        # albums are the albums found in a disc folder, or None for a folder whose albums were passed on already.
+        self.has_audio_descendant = self.has_audio_descendant or has_audio
+        if albums is None:
+            self.has_other_audio = self.has_other_audio or has_audio
+        elif albums == [child]:
+            self.discs.append(child)
+        else:
+            self.held.extend(albums)
+            self.has_other_audio = self.has_other_audio or bool(albums)
+
+    def albums(self):
+        if self.discs and not self.has_audio_file and not self.has_other_audio:
+            # "CD1", "CD2", ... of one release: beautified together, as one album.
+            return [self.folder]
+        albums = self.discs + self.held
+        if self.has_audio_file and not self.has_audio_descendant:
+            albums.append(self.folder)
+        return albums
+
+    def has_audio(self):
+        return self.has_audio_file or self.has_audio_descendant
+
+def _collect_scan(scan):
+    # Runs a scan generator to the end, returning what it yielded and what it returned.
+    albums = []
+    while True:
+        try:
+            albums.append(next(scan))
+        except StopIteration as stop:
+            return albums, stop.value
+
+def _scan_audio_folders(path: Path, state_cache: AlbumStateCache = None, known: dict = None):
+    # known maps subfolders already scanned to their (albums, has audio) result, which is used instead of listing them again.
+    instrumentation.count("listdir")
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return False
+
+    if state_cache is not None and state_cache.is_unchanged(path, entries, is_disc_folder_name):
+        # Already beautified and untouched since: nothing to yield and no need to descend.
+        return True
+
+    discovery = FolderDiscovery(path)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks = False):
+            child_path = Path(entry.path)
+            if known is not None and child_path in known:
+                albums, has_audio = known[child_path]
+                if is_disc_folder_name(entry.name):
+                    discovery.add_child(child_path, albums, has_audio)
+                else:
+                    yield from albums
+                    discovery.add_child(child_path, None, has_audio)
+                continue
+            if not is_disc_folder_name(entry.name):
+                discovery.add_child(child_path, None, (yield from _scan_audio_folders(child_path, state_cache)))
+                continue
+            # Albums of disc folders are held back until it is known whether this folder is a disc set.
+            albums, has_audio = _collect_scan(_scan_audio_folders(child_path, state_cache))
+            discovery.add_child(child_path, albums, has_audio)
+        elif not discovery.has_audio_file and entry.is_file() and is_audio_file(Path(entry.name)):
+            discovery.has_audio_file = True
+    yield from discovery.albums()
+    return discovery.has_audio()
+
+def iter_deepest_audio_folders(root: Path, state_cache: AlbumStateCache = None):
+    # Single bottom-up walk: a folder is yielded as soon as its own subtree has been listed,
+    # so callers may start beautifying it while the rest of the library is still being scanned.
+    # The folder holding the discs of a multi-disc set is yielded instead of the discs.
+    if not root.is_dir():
+        return
+    yield from _scan_audio_folders(root, state_cache)
+
+def discover_albums(path: Path, state_cache: AlbumStateCache = None, shard = None):
+    # With a shard only the albums of its top-level folders are discovered.
+    if shard is None:
+        return iter_deepest_audio_folders(path, state_cache)
+    from shard import iter_shard_albums
+    return iter_shard_albums(path, shard, state_cache)
+
 def base_name(path: Path):
     return re.sub(r'(\.[^.]+)+$', '', path.name)
 
@@ -86,74 +498,323 @@ def ensure_folder_uppercased(path: Path):
     new_folder_name = current_folder_name.capitalize()
     os.rename(temp_path, Path(parent_dir) / new_folder_name)
 
-def move_and_rename_if_exists(source_path: Path, target_folder_path: Path):
-    name = source_path.name
-    new_path = Path()
-    if (target_folder_path / name).exists():
-        index = 1
-        base_filename = base_name(source_path)
-        while True:
-            new_name = base_filename + " (" + str(index) + ")" + source_path.suffix
-            new_path = target_folder_path / new_name
-            if not new_path.exists():
-                break
-            else:
-                ++index
-                if index > _maximum_item_suffix:
-                    new_path = target_folder_path / uuid.uuid4()
-                    break;
-    else:
-        new_path = target_folder_path / name
+def ensure_album_subfolder(album_path: Path, folder_name: str, snapshot: AlbumSnapshot, create: bool = True):
+    # Snapshot counterpart of ensure_folder_exists followed by ensure_folder_uppercased, except that the
+    # rename through a temporary name only happens when the case on disk differs: a tidy album is not written to.
+    album_path = AlbumSnapshot._key(album_path)
+    entries = snapshot.entries(album_path)
+    folder_path = album_path / folder_name
+    existing_name = folder_name if folder_name in entries else next((name for name in entries if name.lower() == folder_name.lower()), None)
+    temp_path = album_path / (folder_name + _temp_folder_suffix)
+    if existing_name is None and temp_path.name in entries:
+        # Stranded between the two renames by an interrupted run.
+        existing_name = temp_path.name
+    if existing_name is None or not entries[existing_name].is_dir:
+        if create:
+            snapshot.mkdir(folder_path)
+        return folder_path
+    if existing_name != folder_name:
+        _rename_album_subfolder(album_path, existing_name, folder_name, snapshot)
+    return folder_path
+
+def _rename_album_subfolder(album_path: Path, existing_name: str, folder_name: str, snapshot: AlbumSnapshot):
+    # Names differing only in case go through a temporary name, which case-insensitive filesystems need.
+    temp_path = album_path / (folder_name + _temp_folder_suffix)
+    if existing_name.lower() != folder_name.lower() and existing_name != temp_path.name:
+        snapshot.rename(album_path / existing_name, album_path / folder_name)
+        return
+    if existing_name != temp_path.name:
+        snapshot.rename(album_path / existing_name, temp_path)
+    snapshot.rename(temp_path, album_path / folder_name)
 
-    target_folder_path.mkdir(parents = True, exist_ok = True)
-    shutil.move(source_path, new_path)
+def album_disc_folders(album_path: Path, snapshot: AlbumSnapshot):
+    # Subfolders of a disc set: named like a disc and holding audio files.
+    album_path = AlbumSnapshot._key(album_path)
+    discs = []
+    for name, entry in list(snapshot.entries(album_path).items()):
+        number = disc_number(name)
+        if entry.is_dir and number is not None and any(file_kind(child) == FileKind.AUDIO for child in snapshot.entries(album_path / name)):
+            discs.append((number, name))
+    return sorted(discs)
 
-def move_files_into_folder(source_path: Path, target_path: Path, filter):
-    for item in source_path.rglob("*"):
+def normalize_disc_folders(album_path: Path, snapshot: AlbumSnapshot = None):
+    # Renames the discs of a set to Names.cd_number_folder ("CD 1", "CD 2", ...); returns their paths.
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    album_path = AlbumSnapshot._key(album_path)
+    disc_paths = []
+    for number, name in album_disc_folders(album_path, snapshot):
+        folder_name = Names.cd_number_folder(str(number))
+        taken = next((other for other in snapshot.entries(album_path) if other.lower() == folder_name.lower()), None)
+        if name != folder_name and (taken is None or taken == name):
+            _rename_album_subfolder(album_path, name, folder_name, snapshot)
+            name = folder_name
+        disc_paths.append(album_path / name)
+    return disc_paths
+
+def free_item_path(source_path: Path, target_folder_path: Path, snapshot: AlbumSnapshot):
+    # The snapshot is the registry of taken names; the next suffix to try is remembered per base name,
+    # so flattening many "cover.jpg" files into one folder does not probe "cover (1)" again and again.
+    new_path = target_folder_path / source_path.name
+    if not snapshot.exists(new_path):
+        return new_path
+    base_filename = base_name(source_path)
+    key = (AlbumSnapshot._key(target_folder_path), base_filename, source_path.suffix)
+    index = snapshot._next_suffixes.get(key, 1)
+    while index <= _maximum_item_suffix:
+        new_path = target_folder_path / (base_filename + " (" + str(index) + ")" + source_path.suffix)
+        index += 1
+        if not snapshot.exists(new_path):
+            snapshot._next_suffixes[key] = index
+            return new_path
+    snapshot._next_suffixes[key] = index
+    import uuid
+    return target_folder_path / (str(uuid.uuid4()) + source_path.suffix)
+
+def move_and_rename_if_exists(source_path: Path, target_folder_path: Path, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(target_folder_path)
+    new_path = free_item_path(source_path, target_folder_path, snapshot)
+    if not snapshot.is_dir(target_folder_path):
+        snapshot.mkdir(target_folder_path)
+    snapshot.move(source_path, new_path)
+
+def move_files_into_folder(source_path: Path, target_path: Path, filter, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(source_path)
+    target_path = AlbumSnapshot._key(target_path)
+    for item in snapshot.rglob(source_path):
         if target_path in item.parents:
             continue
-        if item.is_file() and filter(item):
-            move_and_rename_if_exists(item, target_path)
+        if snapshot.is_file(item) and filter(item):
+            move_and_rename_if_exists(item, target_path, snapshot)
 
-def move_misc_files_into_folder(source_path: Path, target_path: Path):
-    for item in source_path.glob("*"):
+def move_misc_files_into_folder(source_path: Path, target_path: Path, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(source_path)
+    target_path = AlbumSnapshot._key(target_path)
+    for item in snapshot.iterdir(source_path):
         if (target_path in item.parents) or (item == target_path):
             continue
-        if item.is_file():
-            if not is_audio_image_file(item) and not is_audio_file(item) and not is_image_file(item):
-                move_and_rename_if_exists(item, target_path)
+        if snapshot.is_file(item):
+            kind = file_kind(item)
+            if kind != FileKind.AUDIO and kind != FileKind.IMAGE and not is_audio_image_file(item, snapshot):
+                move_and_rename_if_exists(item, target_path, snapshot)
         elif (item.name != Names.artwork_folder_name()):
-            shutil.move(item, target_path / item.name)
-
-def beautify_artwork(album_path: Path):
-    artwork_folder_path = (album_path / Names.artwork_folder_name()).absolute()
-    ensure_folder_exists(artwork_folder_path)
-    ensure_folder_uppercased(artwork_folder_path)
-    move_files_into_folder(album_path, artwork_folder_path, is_image_file)
-
-def beautify_misc(album_path: Path):
-    misc_folder_path = (album_path / Names.misc_folder_name()).absolute()
-    ensure_folder_exists(misc_folder_path)
-    ensure_folder_uppercased(misc_folder_path)
-    move_misc_files_into_folder(album_path, misc_folder_path)
-
-def remove_folders_wo_files_recursively(album_path: Path):
-    for folder in sorted(album_path.rglob("*"), reverse = True):
-        if folder.is_dir() and not any(folder.iterdir()):
-            folder.rmdir()
-
-def remove_files(album_path: Path, regex: str):
-    pattern = re.compile(regex)
-    for file in album_path.rglob("*"):
-        if file.is_file() and pattern.search(file.name):
-            file.unlink()
+            snapshot.move(item, target_path / item.name)
+
+class Destination:
+    # Besides the name of an album subfolder, a routing rule can keep an item where it is or delete it.
+    STAY = "<stay>"
+    DELETE = "<delete>"
+
+class RoutedItem:
+    __slots__ = ("path", "kind", "is_dir", "depth", "snapshot")
+
+    def __init__(self, path: Path, kind, is_dir: bool, depth: int, snapshot: AlbumSnapshot):
+        self.path = path
+        self.kind = kind
+        self.is_dir = is_dir
+        self.depth = depth
+        self.snapshot = snapshot
+
+    @property
+    def top_level(self):
+        return self.depth == 0
+
+def _is_disc_folder(item: RoutedItem):
+    return item.is_dir and item.depth == 0 and is_disc_folder_name(item.path.name)
+
+def _disc_misc_folder(item: RoutedItem):
+    # Extras of a disc keep its name below Misc, so "CD 1/rip.log" and "CD 2/rip.log" stay apart.
+    return Names.misc_folder_name() + "/" + item.path.parent.name
+
+def default_routing_rules(disc_set: bool = False):
+    # (destination, predicate) pairs, the first matching rule wins and unmatched items stay. A destination
+    # is an album subfolder, or a function of the item returning a folder below one, like "Misc/CD 1".
+    # In a disc set the discs stay and whatever is directly inside them goes to the disc's folder in Misc.
+    rules = [
+        (Destination.DELETE, lambda item: not item.is_dir and is_playlist_file(item.path)),
+        (Names.artwork_folder_name(), lambda item: item.kind == FileKind.IMAGE),
+        (Destination.STAY, lambda item: item.kind == FileKind.AUDIO),
+        (Destination.STAY, lambda item: (item.kind == FileKind.CUE or item.kind == FileKind.LOG) and is_audio_image_file(item.path, item.snapshot)),
+    ]
+    if disc_set:
+        rules.append((Destination.STAY, _is_disc_folder))
+    rules.append((Names.misc_folder_name(), lambda item: item.top_level))
+    if disc_set:
+        rules.append((_disc_misc_folder, lambda item: item.depth == 1 and is_disc_folder_name(item.path.parent.name)))
+    return rules
+
+def _route(item: RoutedItem, rules):
+    for destination, matches in rules:
+        if matches(item):
+            return destination
+    return Destination.STAY
+
+def _destination_folder(destination: str, folders: dict, snapshot: AlbumSnapshot):
+    # The album subfolder is created before a folder below it, so the album's listing shows it.
+    name, _, subfolder = destination.partition("/")
+    folder_path = folders[name]
+    if not subfolder:
+        return folder_path
+    if not snapshot.is_dir(folder_path):
+        snapshot.mkdir(folder_path)
+    return folder_path / subfolder
+
+def _route_folder(folder: Path, depth: int, rules, folders: dict, snapshot: AlbumSnapshot, recursive: bool):
+    for path in snapshot.iterdir(folder):
+        entry = snapshot.entry(path)
+        if entry is None or is_tool_file(path.name):
+            # The tool's own files stay in the library root, also when the root is itself an album.
+            continue
+        if entry.is_dir:
+            if recursive:
+                _route_folder(path, depth + 1, rules, folders, snapshot, recursive)
+                if not snapshot.entries(path):
+                    # Empty, or emptied by routing: the prune stage removes it where it is.
+                    continue
+            if depth == 0 and path in folders.values():
+                continue
+        item = RoutedItem(path, None if entry.is_dir else file_kind(path), entry.is_dir, depth, snapshot)
+        destination = _route(item, rules)
+        if callable(destination):
+            destination = destination(item)
+        if destination == Destination.STAY:
+            continue
+        if destination == Destination.DELETE:
+            snapshot.unlink(path)
+            continue
+        target_folder_path = _destination_folder(destination, folders, snapshot)
+        if target_folder_path in path.parents:
+            continue
+        move_and_rename_if_exists(path, target_folder_path, snapshot)
+
+def route_album_files(album_path: Path, rules = None, snapshot: AlbumSnapshot = None, recursive: bool = True):
+    # One traversal of the album: every item is classified once and sent to the destination of the first
+    # matching rule. Folders are routed after their contents, so images leave e.g. "Scans" before it moves to Misc.
+    # Destination folders are only created once something is routed into them.
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    if rules is None:
+        rules = default_routing_rules()
+    album_path = AlbumSnapshot._key(album_path)
+    folders = {}
+    for destination, _ in rules:
+        if not callable(destination) and destination != Destination.STAY and destination != Destination.DELETE and destination not in folders:
+            folders[destination] = ensure_album_subfolder(album_path, destination, snapshot, create = False)
+    _route_folder(album_path, 0, rules, folders, snapshot, recursive)
+
+def beautify_artwork(album_path: Path, snapshot: AlbumSnapshot = None):
+    route_album_files(album_path, [(Names.artwork_folder_name(), lambda item: item.kind == FileKind.IMAGE)], snapshot)
+
+def beautify_misc(album_path: Path, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    image_album = is_audio_image_album(album_path, snapshot)
+    rules = [
+        (Destination.STAY, lambda item: item.is_dir and item.path.name == Names.artwork_folder_name()),
+        (Destination.STAY, lambda item: item.kind == FileKind.IMAGE),
+        (Names.misc_folder_name(), lambda item: item.is_dir or is_misc_file(item.path, image_album, item.snapshot)),
+    ]
+    route_album_files(album_path, rules, snapshot, recursive = False)
+
+def _prune_folder(folder: Path, snapshot: AlbumSnapshot, pattern, remove_empty_folders: bool, release_listings: bool):
+    # Post-order: every folder is listed once, matching files are removed and the entries left are counted,
+    # so a folder is known to be empty without listing it again after its subfolders were pruned.
+    remaining = 0
+    for path in snapshot.iterdir(folder):
+        entry = snapshot.entry(path)
+        if entry is None:
+            continue
+        if entry.is_dir:
+            if _prune_folder(path, snapshot, pattern, remove_empty_folders, release_listings) == 0 and remove_empty_folders:
+                snapshot.rmdir(path)
+                continue
+            if release_listings:
+                snapshot.refresh(path)
+        elif pattern is not None and pattern.search(path.name):
+            snapshot.unlink(path)
+            continue
+        remaining += 1
+    return remaining
+
+def remove_files_and_empty_folders(album_path: Path, regex: str = None, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    pattern = None if regex is None else re.compile(regex)
+    _prune_folder(snapshot._key(album_path), snapshot, pattern, True, False)
+
+def remove_folders_wo_files_recursively(album_path: Path, snapshot: AlbumSnapshot = None):
+    remove_files_and_empty_folders(album_path, None, snapshot)
+
+def remove_files(album_path: Path, regex: str, snapshot: AlbumSnapshot = None):
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    _prune_folder(snapshot._key(album_path), snapshot, re.compile(regex), False, False)
+
+def prune_empty_folders(path: Path, regex: str = None):
+    # Prunes a whole library subtree in one walk; listings of finished subtrees are dropped
+    # right away, so memory stays bounded by the depth of the tree rather than its size.
+    snapshot = AlbumSnapshot(path)
+    pattern = None if regex is None else re.compile(regex)
+    with instrumentation.stage("prune_empty_folders", path):
+        _prune_folder(snapshot.path, snapshot, pattern, True, True)
+
+def deduplicate_album_images(album_path: Path, deduplicator: dedup.Deduplicator, snapshot: AlbumSnapshot = None):
+    # Images identical to one another would only end up in Artwork as "cover (1).jpg" and so on.
+    if snapshot is None:
+        snapshot = AlbumSnapshot(album_path)
+    images = [path for path in snapshot.rglob(album_path) if snapshot.is_file(path) and file_kind(path) == FileKind.IMAGE]
+    artwork_path = snapshot._key(album_path) / Names.artwork_folder_name()
+    return deduplicator.deduplicate(images, snapshot, lambda path: artwork_path)
+
+def album_stages(path: Path, snapshot: AlbumSnapshot):
+    # The stages an album goes through, in order, as (name, function of the album path and snapshot).
+    stages = []
+    deduplicator = dedup.deduplicator()
+    if deduplicator is not None:
+        stages.append(("deduplicate_album_images", lambda path, snapshot: deduplicate_album_images(path, deduplicator, snapshot)))
+    disc_set = bool(album_disc_folders(path, snapshot))
+    if disc_set:
+        stages.append(("normalize_disc_folders", normalize_disc_folders))
+    rules = default_routing_rules(disc_set)
+    stages.append(("route_album_files", lambda path, snapshot: route_album_files(path, rules, snapshot)))
+    stages.append(("remove_folders_wo_files_recursively", remove_folders_wo_files_recursively))
+    return stages
+
+def _beautify_album_stages(path: Path, snapshot: AlbumSnapshot):
+    for name, stage in album_stages(path, snapshot):
+        with instrumentation.stage(name, path):
+            stage(path, snapshot)
+
+def is_canonical_album(path: Path):
+    # The album is planned, not beautified: every folder is listed once, nothing is written,
+    # and a tidy album is one whose plan is empty.
+    return not plan_album_folder(path).operations
 
 def beautify_album_folder(path):
-    print("Beautifying: " + str(path))
-    beautify_artwork(path)
-    beautify_misc(path)
-    remove_files(path, _m3u_regex)
-    remove_folders_wo_files_recursively(path)
+    instrumentation.event("album_started", album = str(path))
+    _beautify_album_stages(path, AlbumSnapshot(path))
+    instrumentation.event("album_finished", album = str(path))
+
+def plan_album_folder(path: Path):
+    plan = AlbumPlan(AlbumSnapshot._key(path))
+    _beautify_album_stages(path, AlbumSnapshot(path, plan))
+    return plan
+
+def beautify_album_folder_journaled(path: Path, journal: Journal):
+    # Planned first, so the whole plan is in the journal before the first operation touches the album.
+    instrumentation.event("album_started", album = str(path))
+    journal.apply_album(plan_album_folder(path), PlanApplier())
+    instrumentation.event("album_finished", album = str(path))
+
+def iter_album_plans(album_paths):
+    for album_path in album_paths:
+        yield plan_album_folder(album_path)
+
+def plan_library(path: Path):
+    return LibraryPlan(list(iter_album_plans(iter_deepest_audio_folders(path))))
 
 class Names:
     @staticmethod
@@ -166,13 +827,214 @@ class Names:
     def cd_number_folder(number):
         return "CD " + number
 
-def main():
-    path = Path(r"D:\Music")
-    #path = Path(r"C:\Users\Boo\Desktop\TestMusic")
-    #path = Path(r"C:\Boo\Temp\TestMusic")
-    for item in path.rglob("*"):
-        if is_deepest_audio_folder(item):
-            beautify_album_folder(item)
+class LibraryReport:
+    # Without record_paths only successes are counted, so the report does not grow with the library.
+    def __init__(self, record_paths: bool = True):
+        self.record_paths = record_paths
+        self.beautified = []
+        self.beautified_count = 0
+        self.errors = {}
+
+    def add(self, path: Path, error):
+        if error is None:
+            self.beautified_count += 1
+            if self.record_paths:
+                self.beautified.append(path)
+        else:
+            self.errors[path] = error
+
+def _beautify_album_folder_safely(path: Path, journal: Journal = None):
+    try:
+        if journal is None:
+            beautify_album_folder(path)
+        else:
+            beautify_album_folder_journaled(path, journal)
+        return path, None
+    except Exception as error:
+        instrumentation.event("album_failed", album = str(path), error = repr(error))
+        return path, repr(error)
+
+def _initialize_worker_process(move_options: dict = None, deduplicator: dedup.Deduplicator = None, cue_cache: cue.CueCache = None):
+    instrumentation.show_progress(instrumentation.ConsoleSink())
+    # Spawned workers start from the defaults, so the settings of the main process are passed on.
+    if move_options is not None:
+        mover.configure(**move_options)
+    # Workers get a copy of the hash and cue caches; entries they add are not saved.
+    if deduplicator is not None:
+        dedup.configure(hash_cache = deduplicator.hash_cache, hard_link = deduplicator.hard_link)
+    if cue_cache is not None:
+        cue.configure(cue_cache)
+
+def beautify_library(path: Path, jobs: int = 1, use_processes: bool = False, state_cache: AlbumStateCache = None,
+                     record_paths: bool = True, journal: Journal = None, shard = None):
+    report = LibraryReport(record_paths)
+    def finish(album_path: Path, error):
+        report.add(album_path, error)
+        if state_cache is not None and error is None:
+            state_cache.update(album_path, is_disc_folder_name)
+
+    albums = instrumentation.timed_iter("discovery", discover_albums(path, state_cache, shard))
+    if journal is not None:
+        # Albums an interrupted run already finished are not planned again.
+        albums = (album_path for album_path in albums if not journal.is_finished(album_path))
+    if jobs <= 1:
+        for album_path in albums:
+            finish(*_beautify_album_folder_safely(album_path, journal))
+        return report
+
+    # Imported here: loading multiprocessing would double the start-up time of single album runs.
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+    executor = ThreadPoolExecutor(max_workers = jobs)
+    if use_processes:
+        # Workers record no stage statistics; only the console progress is reproduced there.
+        executor = ProcessPoolExecutor(max_workers = jobs, initializer = _initialize_worker_process,
+                                       initargs = (mover.default_engine().options(), dedup.deduplicator(), cue.cache()))
+    pending = {}
+    def collect_finished():
+        done, _ = wait(pending, return_when = FIRST_COMPLETED)
+        for future in done:
+            finish(*future.result())
+            del pending[future]
+
+    with executor:
+        for album_path in albums:
+            # Discovery is throttled by the bounded queue, and an album is never handed out while
+            # a nested or enclosing folder is still being beautified.
+            while len(pending) >= jobs * _queued_albums_per_job or any(_paths_overlap(album_path, queued) for queued in pending.values()):
+                collect_finished()
+            pending[executor.submit(_beautify_album_folder_safely, album_path, journal)] = album_path
+        while pending:
+            collect_finished()
+    return report
+
+def _run(arguments):
+    if arguments.watch:
+        from watcher import watch
+        watch(Path(arguments.path))
+        return 0
+    # Discovery, planning and applying are chained generators: only one album is held in memory at a time.
+    if arguments.apply_plan:
+        apply_plan(read_album_plans(arguments.apply_plan))
+        return 0
+    if arguments.dry_run or arguments.plan_file:
+        album_plans = iter_album_plans(discover_albums(Path(arguments.path), shard = arguments.shard))
+        if arguments.plan_file:
+            write_album_plans(arguments.plan_file, album_plans)
+        else:
+            for album_plan in album_plans:
+                if album_plan.operations:
+                    print(album_plan.describe())
+        return 0
+    # Shards keep their state and journal in files of their own, so they can run at the same time.
+    state_cache = AlbumStateCache(Path(arguments.path), shard = arguments.shard) if arguments.incremental else None
+    journal = library_journal(Path(arguments.path), arguments.shard) if arguments.journal else None
+    # The album paths are only kept when a shard has to list them in its manifest.
+    record_paths = arguments.shard is not None
+    try:
+        if journal is not None:
+            for album_path in journal.resume():
+                print("Resumed: " + str(album_path))
+        if arguments.use_async:
+            from async_backend import beautify_library_with_asyncio
+            report = beautify_library_with_asyncio(Path(arguments.path), arguments.concurrency, arguments.per_mount,
+                                                   state_cache, record_paths, arguments.shard)
+        else:
+            report = beautify_library(Path(arguments.path), arguments.jobs, arguments.processes, state_cache,
+                                      record_paths, journal, arguments.shard)
+        if journal is not None:
+            journal.remove()
+    finally:
+        if journal is not None:
+            journal.close()
+        if state_cache is not None:
+            state_cache.save()
+    if arguments.prune:
+        prune_empty_folders(Path(arguments.path))
+    if arguments.shard is not None:
+        from shard import manifest_path, write_manifest
+        write_manifest(arguments.manifest or manifest_path(Path(arguments.path), arguments.shard), Path(arguments.path), arguments.shard, report)
+    print("Beautified albums: " + str(report.beautified_count))
+    for album_path, error in report.errors.items():
+        print("Failed: " + str(album_path) + ": " + error)
+    return 1 if report.errors else 0
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = "Tidies up album folders of a music library.")
+    parser.add_argument("path", help = "the library folder")
+    parser.add_argument("--jobs", type = int, default = 1, help = "number of albums beautified concurrently")
+    parser.add_argument("--processes", action = "store_true", help = "use worker processes instead of threads")
+    parser.add_argument("--async", dest = "use_async", action = "store_true",
+                        help = "overlap filesystem calls with asyncio, for libraries on network shares")
+    parser.add_argument("--concurrency", type = int, default = 32, help = "filesystem calls in flight with --async")
+    parser.add_argument("--per-mount", type = int, default = 8, help = "filesystem calls in flight per mount with --async")
+    parser.add_argument("--dry-run", action = "store_true", help = "print the planned operations without touching the library")
+    parser.add_argument("--plan-file", help = "write the planned operations as JSON instead of applying them")
+    parser.add_argument("--apply-plan", help = "apply operations from a JSON plan written by --plan-file")
+    parser.add_argument("--incremental", action = "store_true", help = "skip albums that are unchanged since they were last beautified")
+    parser.add_argument("--dedup", choices = ["drop", "link"],
+                        help = "drop byte-identical artwork; with link, copies bound for another folder become hard links to the copy kept")
+    parser.add_argument("--journal", action = "store_true",
+                        help = "journal every album's operations, and resume from the journal of an interrupted run")
+    parser.add_argument("--prune", action = "store_true", help = "remove empty folders anywhere in the library afterwards")
+    parser.add_argument("--shard", help = "beautify only shard i/N of the library, split by top-level folder; i counts from 0")
+    parser.add_argument("--manifest", help = "where a shard writes its results; by default a file in the library root")
+    parser.add_argument("--watch", action = "store_true", help = "keep running and beautify albums as they are copied into the library")
+    parser.add_argument("--stats", action = "store_true", help = "print time and filesystem calls per stage and the slowest albums")
+    parser.add_argument("--events", help = "append structured events as JSON lines to this file")
+    parser.add_argument("--profile", help = "write a cProfile dump of the run to this file")
+    parser.add_argument("--copy-buffer", type = int, default = 8, help = "MiB copied per call when moving across devices")
+    parser.add_argument("--fsync", action = "store_true", help = "fsync every file copied across devices")
+    parser.add_argument("--progress", action = "store_true", help = "show progress of files copied across devices")
+    arguments = parser.parse_args(argv)
+    if arguments.journal and (arguments.processes or arguments.use_async):
+        parser.error("--journal works with thread workers only")
+    if arguments.shard is not None:
+        from shard import Shard
+        try:
+            arguments.shard = Shard.parse(arguments.shard)
+        except ValueError as error:
+            parser.error(str(error))
+        if arguments.prune or arguments.watch or arguments.apply_plan:
+            parser.error("--shard cannot be combined with --prune, --watch or --apply-plan")
+    mover.configure(buffer_size = arguments.copy_buffer * 1024 * 1024, fsync = arguments.fsync,
+                    progress = mover.ConsoleProgress() if arguments.progress else None)
+    if arguments.dedup:
+        dedup.configure(hash_cache = dedup.library_hash_cache(Path(arguments.path), arguments.shard), hard_link = arguments.dedup == "link")
+    if arguments.incremental:
+        # Repeated runs also keep the cue sheets they parsed.
+        cue.configure(cue.library_cue_cache(Path(arguments.path), arguments.shard))
+
+    sinks = [instrumentation.ConsoleSink()]
+    if arguments.events:
+        sinks.append(instrumentation.JsonLinesSink(arguments.events))
+    if arguments.stats or arguments.events:
+        recorder = instrumentation.enable(instrumentation.Recorder(sinks))
+    else:
+        # Nothing is reported, so nothing is recorded; only the progress lines are printed.
+        instrumentation.show_progress(sinks[0])
+    profiler = None
+    if arguments.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return _run(arguments)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(arguments.profile)
+        instrumentation.disable()
+        if dedup.deduplicator() is not None:
+            dedup.deduplicator().hash_cache.save()
+            dedup.disable()
+        if arguments.incremental:
+            cue.cache().save()
+            cue.configure(cue.CueCache())
+        if arguments.events:
+            sinks[1].close()
+        if arguments.stats:
+            print(recorder.summary())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,208 @@
+import errno
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import instrumentation
+
+_default_buffer_size = 8 * 1024 * 1024
+_hash_buffer_size = 1024 * 1024
+_partial_suffix = ".partial"
+# Devices of the most recently used folders: enough for the albums in flight, without growing with the library.
+_cached_devices = 256
+_unsupported_copy_errors = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP)
+
+# hashlib and shutil are only needed across devices; they are imported there, which keeps them
+# out of the start-up of the common single-filesystem run.
+
+def file_hash(path: Path):
+    import hashlib
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(_hash_buffer_size)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+def partial_path(target_path: Path):
+    return target_path.with_name(target_path.name + _partial_suffix)
+
+def link_file(source_path: Path, target_path: Path):
+    # Replaces the target with a hard link to the source; the target is never missing in between.
+    temp_path = partial_path(target_path)
+    os.link(source_path, temp_path)
+    os.replace(temp_path, target_path)
+
+class ConsoleProgress:
+    # Progress callback printing one updating line per copied file.
+    def __init__(self, stream = None):
+        self.stream = stream
+
+    def __call__(self, source_path: Path, copied: int, total: int, seconds: float):
+        stream = self.stream or sys.stderr
+        percent = 100 * copied // total if total else 100
+        throughput = copied / seconds / (1024 * 1024) if seconds else 0.0
+        end = "\n" if copied >= total else ""
+        print("\rCopying %s: %3d%% (%.1f MiB/s)" % (source_path.name, percent, throughput), end = end, file = stream)
+
+class MoveEngine:
+    # Moves within one filesystem are a single atomic os.rename. Across filesystems files are streamed
+    # with copy_file_range/sendfile into "<target>.partial", verified by size and hash and only then
+    # renamed into place and removed from the source, so an interrupted copy can be resumed.
+    def __init__(self, buffer_size: int = _default_buffer_size, fsync: bool = False, verify: bool = True, progress = None):
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.verify = verify
+        self.progress = progress
+        self._devices = OrderedDict()
+        self._devices_lock = threading.Lock()
+        self._unsupported_methods = set()
+
+    def options(self):
+        # The settings given to the constructor, e.g. to configure the engines of worker processes alike.
+        return {"buffer_size": self.buffer_size, "fsync": self.fsync, "verify": self.verify, "progress": self.progress}
+
+    def device(self, folder: Path):
+        with self._devices_lock:
+            device = self._devices.get(folder)
+            if device is not None:
+                self._devices.move_to_end(folder)
+                return device
+        instrumentation.count("stat")
+        device = os.stat(folder).st_dev
+        with self._devices_lock:
+            self._devices[folder] = device
+            if len(self._devices) > _cached_devices:
+                self._devices.popitem(last = False)
+        return device
+
+    def forget(self, folder: Path):
+        with self._devices_lock:
+            self._devices.pop(folder, None)
+
+    def is_same_device(self, source_path: Path, target_path: Path):
+        return self.device(source_path.parent) == self.device(target_path.parent)
+
+    def move(self, source_path: Path, target_path: Path):
+        source_path = Path(source_path)
+        target_path = Path(target_path)
+        if self.is_same_device(source_path, target_path):
+            instrumentation.count("rename")
+            os.rename(source_path, target_path)
+        elif source_path.is_dir() and not source_path.is_symlink():
+            self._move_folder_across_devices(source_path, target_path)
+        else:
+            self._move_file_across_devices(source_path, target_path)
+
+    def _move_folder_across_devices(self, source_path: Path, target_path: Path):
+        import shutil
+        instrumentation.count("mkdir")
+        target_path.mkdir(exist_ok = True)
+        shutil.copystat(source_path, target_path)
+        for entry in list(os.scandir(source_path)):
+            self.move(Path(entry.path), target_path / entry.name)
+        instrumentation.count("rmdir")
+        source_path.rmdir()
+
+    def _move_file_across_devices(self, source_path: Path, target_path: Path):
+        if source_path.is_symlink():
+            os.symlink(os.readlink(source_path), target_path)
+            source_path.unlink()
+            return
+        temp_path = partial_path(target_path)
+        size = os.stat(source_path).st_size
+        self.copy_file(source_path, temp_path)
+        if not self._is_verified_copy(source_path, temp_path, size):
+            # A stale or corrupted partial file: start over once from scratch.
+            temp_path.unlink()
+            self.copy_file(source_path, temp_path)
+            if not self._is_verified_copy(source_path, temp_path, size):
+                raise OSError(errno.EIO, "Copy verification failed", str(source_path))
+        import shutil
+        shutil.copystat(source_path, temp_path)
+        os.replace(temp_path, target_path)
+        instrumentation.count("unlink")
+        source_path.unlink()
+
+    def _is_verified_copy(self, source_path: Path, copy_path: Path, size: int):
+        if os.stat(copy_path).st_size != size:
+            return False
+        return not self.verify or file_hash(source_path) == file_hash(copy_path)
+
+    def copy_file(self, source_path: Path, target_path: Path):
+        # Continues after the end of an existing (partial) target, so an interrupted copy resumes where it stopped.
+        start = time.perf_counter()
+        binary = getattr(os, "O_BINARY", 0)
+        source = os.open(source_path, os.O_RDONLY | binary)
+        try:
+            target = os.open(target_path, os.O_WRONLY | os.O_CREAT | binary, 0o666)
+            try:
+                total = os.fstat(source).st_size
+                offset = os.fstat(target).st_size
+                if offset > total:
+                    os.ftruncate(target, 0)
+                    offset = 0
+                os.lseek(target, offset, os.SEEK_SET)
+                while offset < total:
+                    copied = self._copy_chunk(source, target, offset, min(self.buffer_size, total - offset))
+                    if copied == 0:
+                        break
+                    offset += copied
+                    instrumentation.count("bytes_copied", copied)
+                    if self.progress is not None:
+                        self.progress(source_path, offset, total, time.perf_counter() - start)
+                if self.fsync:
+                    os.fsync(target)
+            finally:
+                os.close(target)
+        finally:
+            os.close(source)
+        seconds = time.perf_counter() - start
+        instrumentation.event("copy_finished", source = str(source_path), target = str(target_path), bytes = offset,
+                              seconds = seconds, throughput = offset / seconds if seconds else None)
+        return offset
+
+    def _copy_chunk(self, source: int, target: int, offset: int, count: int):
+        # Zero-copy first; methods the filesystems refuse are remembered and not retried for later chunks.
+        for method in (_copy_file_range, _sendfile):
+            if method in self._unsupported_methods:
+                continue
+            try:
+                copied = method(source, target, offset, count)
+            except OSError as error:
+                if error.errno not in _unsupported_copy_errors:
+                    raise
+                copied = None
+            if copied:
+                return copied
+            self._unsupported_methods.add(method)
+        os.lseek(source, offset, os.SEEK_SET)
+        data = os.read(source, count)
+        written = 0
+        while written < len(data):
+            written += os.write(target, data[written:])
+        return len(data)
+
+def _copy_file_range(source: int, target: int, offset: int, count: int):
+    if not hasattr(os, "copy_file_range"):
+        return None
+    return os.copy_file_range(source, target, count, offset)
+
+def _sendfile(source: int, target: int, offset: int, count: int):
+    if not hasattr(os, "sendfile") or not sys.platform.startswith("linux"):
+        return None
+    return os.sendfile(target, source, offset, count)
+
+_default_engine = MoveEngine()
+
+def default_engine():
+    return _default_engine
+
+def configure(**options):
+    global _default_engine
+    _default_engine = MoveEngine(**options)
+    return _default_engine
@@ -0,0 +1,174 @@
+import json
+import os
+from pathlib import Path
+
+from mover import MoveEngine, default_engine, link_file
+
+class Operation:
+    MKDIR = "mkdir"
+    RENAME = "rename"
+    MOVE = "move"
+    UNLINK = "unlink"
+    RMDIR = "rmdir"
+    LINK = "link"
+
+    def __init__(self, kind: str, source: Path, target: Path = None):
+        self.kind = kind
+        self.source = Path(source)
+        self.target = None if target is None else Path(target)
+
+    def __eq__(self, other):
+        return isinstance(other, Operation) and (self.kind, self.source, self.target) == (other.kind, other.source, other.target)
+
+    def __repr__(self):
+        if self.target is None:
+            return self.kind + " " + str(self.source)
+        return self.kind + " " + str(self.source) + " -> " + str(self.target)
+
+    def to_json(self):
+        operation = {"operation": self.kind, "source": str(self.source)}
+        if self.target is not None:
+            operation["target"] = str(self.target)
+        return operation
+
+    @staticmethod
+    def from_json(operation: dict):
+        return Operation(operation["operation"], operation["source"], operation.get("target"))
+
+class AlbumPlan:
+    def __init__(self, path: Path, operations = None):
+        self.path = Path(path)
+        self.operations = [] if operations is None else operations
+
+    def add(self, kind: str, source: Path, target: Path = None):
+        self.operations.append(Operation(kind, source, target))
+
+    def to_json(self):
+        return {"path": str(self.path), "operations": [operation.to_json() for operation in self.operations]}
+
+    @staticmethod
+    def from_json(album: dict):
+        return AlbumPlan(album["path"], [Operation.from_json(operation) for operation in album["operations"]])
+
+    def describe(self):
+        return "\n".join([str(self.path) + ":"] + ["    " + repr(operation) for operation in self.operations])
+
+_plan_file_header = '{"albums": ['
+_plan_file_footer = ']}'
+
+def write_album_plans(path: Path, albums):
+    # One album per line inside a regular JSON document, so plans of any size are written
+    # and read back one album at a time.
+    with open(path, "w", encoding = "utf-8") as file:
+        file.write(_plan_file_header + "\n")
+        separator = ""
+        for album in albums:
+            if not album.operations:
+                continue
+            file.write(separator + json.dumps(album.to_json(), ensure_ascii = False))
+            separator = ",\n"
+        file.write("\n" + _plan_file_footer + "\n")
+
+def read_album_plans(path: Path):
+    with open(path, encoding = "utf-8") as file:
+        if file.readline().strip() != _plan_file_header:
+            file.seek(0)
+            yield from (AlbumPlan.from_json(album) for album in json.load(file)["albums"])
+            return
+        for line in file:
+            line = line.strip().rstrip(",")
+            if line and line != _plan_file_footer:
+                yield AlbumPlan.from_json(json.loads(line))
+
+class LibraryPlan:
+    def __init__(self, albums = None):
+        self.albums = [] if albums is None else albums
+
+    def operations(self):
+        for album in self.albums:
+            yield from album.operations
+
+    def describe(self):
+        return "\n".join(album.describe() for album in self.albums if album.operations)
+
+    def to_json(self):
+        return {"albums": [album.to_json() for album in self.albums if album.operations]}
+
+    @staticmethod
+    def from_json(plan: dict):
+        return LibraryPlan([AlbumPlan.from_json(album) for album in plan["albums"]])
+
+    def save(self, path: Path):
+        write_album_plans(path, self.albums)
+
+    @staticmethod
+    def load(path: Path):
+        return LibraryPlan(list(read_album_plans(path)))
+
+def _paths_overlap(first: Path, second: Path):
+    return first == second or first in second.parents or second in first.parents
+
+def _operation_paths(operation: Operation):
+    return [operation.source] if operation.target is None else [operation.source, operation.target]
+
+def operation_batches(operations):
+    # Splits an album's operations into consecutive batches whose paths do not overlap, so the operations
+    # of a batch can run in any order or concurrently while an operation still never overtakes one it
+    # depends on (mkdir before moving into the folder, moves out of a folder before its rmdir, ...).
+    batch = []
+    batch_paths = []
+    for operation in operations:
+        paths = _operation_paths(operation)
+        if any(_paths_overlap(path, batch_path) for path in paths for batch_path in batch_paths):
+            yield batch
+            batch = []
+            batch_paths = []
+        batch.append(operation)
+        batch_paths.extend(paths)
+    if batch:
+        yield batch
+
+def _written_folder(operation: Operation):
+    return str((operation.source if operation.target is None else operation.target).parent)
+
+class PlanApplier:
+    # Executes planned operations album by album. Within a batch of independent operations they are
+    # grouped by the folder they write to, so e.g. all moves into Artwork are done together.
+    # Moves go through the move engine: os.rename on the same device, a verified streaming copy otherwise.
+    def __init__(self, move_engine: MoveEngine = None):
+        self.move_engine = default_engine() if move_engine is None else move_engine
+
+    def move(self, source_path: Path, target_path: Path):
+        self.move_engine.move(source_path, target_path)
+
+    def apply_operation(self, operation: Operation):
+        if operation.kind == Operation.MKDIR:
+            operation.source.mkdir(parents = True, exist_ok = True)
+        elif operation.kind == Operation.RENAME:
+            os.rename(operation.source, operation.target)
+        elif operation.kind == Operation.MOVE:
+            self.move(operation.source, operation.target)
+        elif operation.kind == Operation.UNLINK:
+            operation.source.unlink()
+        elif operation.kind == Operation.RMDIR:
+            operation.source.rmdir()
+            self.move_engine.forget(operation.source)
+        elif operation.kind == Operation.LINK:
+            link_file(operation.source, operation.target)
+        else:
+            raise ValueError("Unknown operation: " + operation.kind)
+
+    def apply_album(self, album: AlbumPlan):
+        for batch in operation_batches(album.operations):
+            for operation in sorted(batch, key = _written_folder):
+                self.apply_operation(operation)
+
+    def apply(self, albums):
+        # Takes a LibraryPlan or any iterable of album plans, e.g. the read_album_plans generator.
+        if isinstance(albums, LibraryPlan):
+            albums = albums.albums
+        for album in albums:
+            self.apply_album(album)
+
+def apply_plan(albums):
+    PlanApplier().apply(albums)
@@ -0,0 +1,130 @@
+import json
+import os
+import zlib
+from pathlib import Path
+
+from main import is_audio_file, is_disc_folder_name, iter_deepest_audio_folders
+
+# A library is split between processes or machines by its top-level (artist) folders. The shard of a folder
+# depends on its name only, so every worker agrees on it without talking to the others, and albums never
+# span two top-level folders, so no album is beautified by two shards.
+
+_manifest_version = 1
+
+def shard_index(name: str, count: int):
+    # crc32 rather than hash(): string hashes differ between interpreter runs.
+    return zlib.crc32(name.encode("utf-8", "surrogateescape")) % count
+
+class Shard:
+    # Shard index of count, counted from 0: "--shard 0/4" ... "--shard 3/4".
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("Invalid shard: " + str(index) + "/" + str(count))
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def parse(text: str):
+        index, separator, count = text.partition("/")
+        if not separator:
+            raise ValueError("Invalid shard: " + text)
+        return Shard(int(index), int(count))
+
+    def __str__(self):
+        return str(self.index) + "/" + str(self.count)
+
+    def owns(self, top_level_name: str):
+        return shard_index(top_level_name, self.count) == self.index
+
+    def file_name(self, file_name: str):
+        # Per-shard name for the state, hash cache and journal files, which shards must not share.
+        stem, extension = os.path.splitext(file_name)
+        return stem + ".shard-" + str(self.index) + "-of-" + str(self.count) + extension
+
+def iter_shard_albums(library_path: Path, shard: Shard, state_cache = None):
+    # Each owned top-level folder is discovered on its own, so a shard lists only its part of the library.
+    # Audio files or disc folders right in the library root make the root itself (part of) an album;
+    # such albums belong to shard 0, which walks the whole library to apply the usual rules to them.
+    library_path = Path(library_path)
+    try:
+        entries = list(os.scandir(library_path))
+    except OSError:
+        return
+    top_level_folders = []
+    root_has_albums = False
+    for entry in entries:
+        if entry.is_dir(follow_symlinks = False):
+            if not is_disc_folder_name(entry.name):
+                top_level_folders.append(entry)
+            else:
+                root_has_albums = True
+        elif entry.is_file() and is_audio_file(Path(entry.name)):
+            root_has_albums = True
+    if root_has_albums and shard.index == 0:
+        for album_path in iter_deepest_audio_folders(library_path, state_cache):
+            if album_path == library_path or is_disc_folder_name(album_path.relative_to(library_path).parts[0]):
+                yield album_path
+    for entry in top_level_folders:
+        if shard.owns(entry.name):
+            yield from iter_deepest_audio_folders(library_path / entry.name, state_cache)
+
+def manifest_path(library_path: Path, shard: Shard):
+    return Path(os.path.abspath(library_path)) / shard.file_name(".beautifier_manifest.json")
+
+def write_manifest(file_path: Path, library_path: Path, shard: Shard, report):
+    manifest = {"version": _manifest_version,
+                "library": os.path.abspath(library_path),
+                "shard": shard.index,
+                "count": shard.count,
+                "beautified_count": report.beautified_count,
+                "beautified": [str(path) for path in report.beautified],
+                "errors": {str(path): error for path, error in report.errors.items()}}
+    temp_path = Path(str(file_path) + ".tmp")
+    with open(temp_path, "w", encoding = "utf-8") as file:
+        json.dump(manifest, file, ensure_ascii = False, indent = 1)
+    os.replace(temp_path, file_path)
+
+def read_manifest(file_path: Path):
+    with open(file_path, encoding = "utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("version") != _manifest_version:
+        raise ValueError("Unsupported manifest: " + str(file_path))
+    return manifest
+
+def _overlapping_albums(album_paths):
+    # An album listed twice, or inside another listed album, means two shards wrote the same files.
+    seen = set()
+    overlapping = []
+    for album_path in map(Path, album_paths):
+        if album_path in seen:
+            overlapping.append(album_path)
+        seen.add(album_path)
+    for album_path in seen:
+        if any(parent in seen for parent in album_path.parents):
+            overlapping.append(album_path)
+    return sorted(overlapping)
+
+def merge_manifests(manifests):
+    # Combines the manifests of one sharded run; shards that wrote no manifest are listed as missing.
+    if not manifests:
+        raise ValueError("No manifests to merge")
+    library = manifests[0]["library"]
+    count = manifests[0]["count"]
+    shards = set()
+    merged = {"version": _manifest_version, "library": library, "count": count,
+              "beautified_count": 0, "beautified": [], "errors": {}}
+    for manifest in manifests:
+        if manifest["library"] != library or manifest["count"] != count:
+            raise ValueError("Manifests of different runs: " + manifest["library"] + " " + str(manifest["shard"]) + "/" + str(manifest["count"]))
+        if manifest["shard"] in shards:
+            raise ValueError("Shard merged twice: " + str(manifest["shard"]) + "/" + str(count))
+        shards.add(manifest["shard"])
+        merged["beautified_count"] += manifest["beautified_count"]
+        merged["beautified"].extend(manifest["beautified"])
+        merged["errors"].update(manifest["errors"])
+    overlapping = _overlapping_albums(merged["beautified"] + list(merged["errors"]))
+    if overlapping:
+        raise ValueError("Albums processed by more than one shard: " + ", ".join(map(str, overlapping)))
+    merged["beautified"].sort()
+    merged["missing_shards"] = [index for index in range(count) if index not in shards]
+    return merged
@@ -0,0 +1,114 @@
+import json
+import os
+from pathlib import Path
+
+_tool_file_prefix = ".beautifier_"
+_state_file_name = _tool_file_prefix + "state.json"
+_state_version = 2
+
+def is_tool_file(name: str):
+    # The state, caches, journal and shard manifests kept in the library root, and their temporary copies.
+    return name.startswith(_tool_file_prefix)
+
+def _entry_name(entry: os.DirEntry):
+    return entry.name + "/" if entry.is_dir(follow_symlinks = False) else entry.name
+
+def album_fingerprint(path: Path, entries, nested_folder = None, use_mtime: bool = True):
+    # Directory mtime plus a hash of the entry list; entries are the os.DirEntry objects of the folder.
+    # nested_folder tells by name which subfolders are part of the album itself, like the "CD N" folders
+    # of a multi-disc set; their entries are hashed too, since changes in them do not show in the album's listing.
+    import hashlib
+    names = sorted(_entry_name(entry) for entry in entries if not is_tool_file(entry.name))
+    if nested_folder is not None:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks = False) and nested_folder(entry.name):
+                with os.scandir(entry.path) as iterator:
+                    names += sorted(entry.name + "/" + _entry_name(nested_entry) for nested_entry in iterator)
+    digest = hashlib.sha1("\0".join(names).encode("utf-8", "surrogateescape")).hexdigest()
+    return (str(os.stat(path).st_mtime_ns) if use_mtime else "") + ":" + digest
+
+class JsonCache:
+    # A cache kept in one JSON file tagged with a format version. A file of another version, or one that cannot
+    # be read, leaves the cache empty, and saving replaces the file with a complete temporary copy, so an interrupted
+    # run never leaves it half written. Without a file path the cache lives in memory only.
+    # Subclasses set version and convert their entries to and from the fields of the file.
+    version = 1
+
+    def __init__(self, file_path: Path = None):
+        self.file_path = None if file_path is None else Path(file_path)
+        self._changed = False
+        self.load()
+
+    def _load_fields(self, fields: dict):
+        raise NotImplementedError()
+
+    def _fields(self):
+        raise NotImplementedError()
+
+    def load(self):
+        if self.file_path is None:
+            return
+        try:
+            with open(self.file_path, encoding = "utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        if state.get("version") == self.version:
+            self._load_fields(state)
+
+    def save(self):
+        if self.file_path is None or not self._changed:
+            return
+        temp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        with open(temp_path, "w", encoding = "utf-8") as file:
+            json.dump(dict({"version": self.version}, **self._fields()), file, separators = (",", ":"))
+        os.replace(temp_path, self.file_path)
+        self._changed = False
+
+class AlbumStateCache(JsonCache):
+    # Remembers the fingerprint of every album folder beautified so far, keyed by its path
+    # relative to the library root, so unchanged albums can be skipped on the next run.
+    version = _state_version
+
+    def __init__(self, library_path: Path, file_name: str = _state_file_name, shard = None):
+        self.library_path = Path(os.path.abspath(library_path))
+        self._albums = {}
+        super().__init__(self.library_path / (file_name if shard is None else shard.file_name(file_name)))
+
+    def _key(self, path: Path):
+        return Path(os.path.relpath(os.path.abspath(path), self.library_path)).as_posix()
+
+    def _fingerprint(self, path: Path, entries, nested_folder):
+        # Saving the tool's own files changes the mtime of the library root, so an album there is told by its entries alone.
+        return album_fingerprint(path, entries, nested_folder, Path(os.path.abspath(path)) != self.library_path)
+
+    def __contains__(self, path: Path):
+        return self._key(path) in self._albums
+
+    def __len__(self):
+        return len(self._albums)
+
+    def _load_fields(self, fields: dict):
+        self._albums = fields.get("albums", {})
+
+    def _fields(self):
+        return {"albums": self._albums}
+
+    def is_unchanged(self, path: Path, entries, nested_folder = None):
+        fingerprint = self._albums.get(self._key(path))
+        if fingerprint is None:
+            return False
+        try:
+            return fingerprint == self._fingerprint(path, entries, nested_folder)
+        except OSError:
+            return False
+
+    def update(self, path: Path, nested_folder = None):
+        with os.scandir(path) as iterator:
+            fingerprint = self._fingerprint(path, list(iterator), nested_folder)
+        self._albums[self._key(path)] = fingerprint
+        self._changed = True
+
+    def forget(self, path: Path):
+        if self._albums.pop(self._key(path), None) is not None:
+            self._changed = True
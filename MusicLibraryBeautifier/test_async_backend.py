@@ -0,0 +1,50 @@
+import threading
+from pathlib import Path
+
+from async_backend import beautify_library_with_asyncio
+import cue
+import dedup
+
+def test_beautify_library_with_asyncio(fs):
+    library_path = Path("/library")
+    for album in ["album1", "album2", "album3"]:
+        fs.create_file(library_path / album / "t1.flac")
+        fs.create_file(library_path / album / "t1.m3u")
+        fs.create_file(library_path / album / "notes.txt")
+        fs.create_file(library_path / album / "scans" / "front.jpg")
+        fs.create_file(library_path / album / "scans" / "back.jpg")
+    report = beautify_library_with_asyncio(library_path, concurrency = 4, per_mount_concurrency = 2)
+    assert(not report.errors)
+    assert(len(report.beautified) == 3)
+    for album in ["album1", "album2", "album3"]:
+        album_path = library_path / album
+        assert((album_path / "t1.flac").exists())
+        assert((album_path / "Artwork" / "front.jpg").exists())
+        assert((album_path / "Artwork" / "back.jpg").exists())
+        assert((album_path / "Misc" / "notes.txt").exists())
+        assert(not (album_path / "scans").exists())
+        assert(not (album_path / "Misc" / "t1.m3u").exists())
+
+def test_files_are_read_off_the_event_loop(fs, monkeypatch):
+    library_path = Path("/library")
+    fs.create_file(library_path / "album" / "album.flac")
+    fs.create_file(library_path / "album" / "album.cue", contents = 'FILE "album.wav" WAVE')
+    fs.create_file(library_path / "album" / "front.jpg", contents = "front")
+    fs.create_file(library_path / "album" / "scans" / "front.jpg", contents = "front")
+    monkeypatch.setattr(cue, "_cache", cue.CueCache())
+    threads = set()
+    def recording(function):
+        def recording_function(*args):
+            threads.add(threading.current_thread())
+            return function(*args)
+        return recording_function
+    monkeypatch.setattr(cue, "parse_cue_sheet", recording(cue.parse_cue_sheet))
+    monkeypatch.setattr(dedup.mover, "file_hash", recording(dedup.mover.file_hash))
+    dedup.configure()
+    try:
+        report = beautify_library_with_asyncio(library_path, concurrency = 2, per_mount_concurrency = 2)
+    finally:
+        dedup.disable()
+    assert(not report.errors)
+    assert(sorted(path.name for path in (library_path / "album" / "Artwork").iterdir()) == ["front.jpg"])
+    assert(len(threads) > 0 and threading.main_thread() not in threads)
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from benchmark import generate_library
+from benchmark import run_benchmark
+from main import iter_deepest_audio_folders
+
+def test_generate_library(fs):
+    library_path = Path("/library")
+    file_count = generate_library(library_path, albums = 10, multi_cd_ratio = 0.0, seed = 1)
+    assert(file_count == sum(1 for path in library_path.rglob("*") if path.is_file()))
+    assert(len(list(iter_deepest_audio_folders(library_path))) == 10)
+
+    library_path = Path("/multi_cd_library")
+    generate_library(library_path, albums = 4, multi_cd_ratio = 1.0)
+    assert(all(album.name.startswith("Album") for album in iter_deepest_audio_folders(library_path)))
+
+def test_run_benchmark(fs):
+    results = run_benchmark(Path("/work"), albums = 5, tracks = 2)
+    assert(results["albums"] >= 5)
+    assert(results["discovery"]["syscalls"]["scandir"] > 0)
+    assert(set(results["stages"]) == {"route_album_files", "remove_folders_wo_files_recursively"})
+    assert(results["full"]["syscalls"]["rename"] > 0)
+    assert(not Path("/work/library").exists())
+
+def test_run_benchmark_stages_disc_sets(fs):
+    results = run_benchmark(Path("/work"), albums = 3, tracks = 2, multi_cd_ratio = 1.0)
+    assert(set(results["stages"]) == {"normalize_disc_folders", "route_album_files", "remove_folders_wo_files_recursively"})
+    assert(results["stages"]["normalize_disc_folders"]["syscalls"]["rename"] > 0)
@@ -0,0 +1,56 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import cli
+import main
+
+def test_scan_lists_albums(fs, capsys, create_album):
+    create_album(Path("/library/artist/album1"))
+    create_album(Path("/library/artist/album2"))
+    assert(cli.main(["scan", "/library"]) == 0)
+    assert(sorted(capsys.readouterr().out.split()) == ["/library/artist/album1", "/library/artist/album2"])
+
+def test_beautify_single_album(fs, capsys, create_album):
+    create_album(Path("/library/artist/album1"))
+    create_album(Path("/library/artist/album2"))
+    assert(cli.main(["beautify", "/library/artist/album1"]) == 0)
+    assert(Path("/library/artist/album1/Artwork/front.jpg").exists())
+    assert(Path("/library/artist/album2/scans/front.jpg").exists())
+    assert(cli.main(["beautify", "--dry-run", "/library/artist/album2"]) == 0)
+    assert("/library/artist/album2/Misc" in capsys.readouterr().out)
+    assert(Path("/library/artist/album2/scans/front.jpg").exists())
+
+def test_verify_lists_untidy_albums(fs, capsys, create_album):
+    create_album(Path("/library/artist/album1"))
+    create_album(Path("/library/artist/album2"))
+    cli.main(["beautify", "/library/artist/album1"])
+    capsys.readouterr()
+    assert(cli.main(["verify", "/library"]) == 1)
+    assert(capsys.readouterr().out.split() == ["/library/artist/album2"])
+
+def test_plan_and_apply(fs, create_album):
+    create_album(Path("/library/artist/album1"))
+    assert(cli.main(["plan", "/library", "--output", "/plan.json"]) == 0)
+    assert(Path("/library/artist/album1/scans/front.jpg").exists())
+    assert(cli.main(["apply", "/plan.json"]) == 0)
+    assert(Path("/library/artist/album1/Artwork/front.jpg").exists())
+    assert(Path("/library/artist/album1/Misc/notes.txt").exists())
+
+def test_startup_defers_heavy_imports():
+    code = ("import sys, cli, main; main.file_kind('notes.txt'); main.file_kind('t1.flac'); "
+            "print(sorted(name for name in ('mimetypes', 'multiprocessing', 'asyncio', 'watcher', 'hashlib') if name in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd = Path(__file__).parent, capture_output = True, text = True, check = True).stdout
+    assert(output.strip() == "[]")
+
+def _exit_code(function, argv):
+    try:
+        function(argv)
+    except SystemExit as exit:
+        return exit.code
+    return None
+
+def test_library_path_is_required(capsys):
+    assert(_exit_code(main.main, []) == 2)
+    assert(_exit_code(cli.main, ["run"]) == 2)
+    assert("path" in capsys.readouterr().err)
@@ -0,0 +1,115 @@
+import codecs
+from pathlib import Path
+
+import cue
+import instrumentation
+from cue import CueCache
+from cue import parse_cue_sheet
+from cue import resolve_target
+from main import AlbumSnapshot
+from main import beautify_album_folder
+from main import beautify_misc
+from main import is_audio_image_album
+from main import is_audio_image_file
+from main import is_misc_file
+
+_cue_sheet = '''REM GENRE Rock
+PERFORMER "Artist"
+TITLE "Album"
+FILE "C:\\Rips\\{}" WAVE
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+'''
+
+def _setup_cache(monkeypatch, cue_cache: CueCache = None):
+    # Inode numbers of the fake filesystem start over in every test.
+    monkeypatch.setattr(cue, "_cache", CueCache() if cue_cache is None else cue_cache)
+
+def test_parse_cue_sheet():
+    sheet = parse_cue_sheet(b'FILE "Disc One.flac" WAVE\r\n  TRACK 01 AUDIO\r\nfile track02.wav WAVE\r\n')
+    assert(sheet.target_names([]) == ["Disc One.flac", "track02.wav"])
+    sheet = parse_cue_sheet(codecs.BOM_UTF16_LE + _cue_sheet.format("Альбом.wav").encode("utf-16-le"))
+    assert(sheet.target_names([]) == ["Альбом.wav"])
+
+def test_legacy_encoding_is_chosen_by_the_files_present():
+    data = _cue_sheet.format("Альбом.flac").encode("cp1251")
+    assert(parse_cue_sheet(data).target_names(["Альбом.flac"]) == ["Альбом.flac"])
+    data = _cue_sheet.format("Café.flac").encode("cp1252")
+    assert(parse_cue_sheet(data).target_names(["Café.flac"]) == ["Café.flac"])
+
+def test_resolve_target():
+    names = ["CDImage.flac", "Track.APE"]
+    assert(resolve_target("CDImage.flac", names) == "CDImage.flac")
+    assert(resolve_target("track.ape", names) == "Track.APE")
+    assert(resolve_target("CDImage.wav", names) == "CDImage.flac")
+    assert(resolve_target("other.wav", names) is None)
+
+def test_cue_sheets_are_read_once(fs, monkeypatch):
+    _setup_cache(monkeypatch, CueCache(Path("/cues.json")))
+    fs.create_file("/album/CDImage.flac")
+    fs.create_file("/album/Artist - Album.cue", contents = _cue_sheet.format("CDImage.wav"))
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("pairing"):
+            assert(is_audio_image_album(Path("/album")))
+            assert(is_audio_image_file(Path("/album/CDImage.flac")))
+            cue.cache().save()
+            _setup_cache(monkeypatch, CueCache(Path("/cues.json")))
+            assert(is_audio_image_file(Path("/album/Artist - Album.cue")))
+    finally:
+        instrumentation.disable()
+    assert(recorder.stage_totals["pairing"].counters["cue_read"] == 1)
+
+def test_pairing_follows_cue_references(fs, monkeypatch):
+    _setup_cache(monkeypatch)
+    album_path = Path("/album")
+    fs.create_file(album_path / "CDImage.flac")
+    fs.create_file(album_path / "Artist - Album.cue", contents = _cue_sheet.format("CDImage.wav"))
+    fs.create_file(album_path / "Artist - Album.log")
+    fs.create_file(album_path / "bonus.flac")
+    fs.create_file(album_path / "bonus.cue", contents = _cue_sheet.format("CDImage.wav"))
+    fs.create_file(album_path / "info.txt")
+    assert(is_audio_image_file(album_path / "Artist - Album.log"))
+    assert(is_audio_image_file(album_path / "bonus.cue"))
+    assert(not is_audio_image_file(album_path / "bonus.flac"))
+    snapshot = AlbumSnapshot(album_path)
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("misc"):
+            image_album = is_audio_image_album(album_path, snapshot)
+            assert(image_album)
+            assert(not is_misc_file(album_path / "Artist - Album.cue", image_album, snapshot))
+            assert(not is_misc_file(album_path / "bonus.cue", image_album, snapshot))
+            assert(is_misc_file(album_path / "info.txt", image_album, snapshot))
+    finally:
+        instrumentation.disable()
+    assert(recorder.stage_totals["misc"].counters["listdir"] == 1)
+    beautify_album_folder(album_path)
+    assert(sorted(path.name for path in album_path.iterdir()) ==
+           ["Artist - Album.cue", "Artist - Album.log", "CDImage.flac", "Misc", "bonus.cue", "bonus.flac"])
+
+def test_per_track_cue_sheet_is_not_an_audio_image(fs, monkeypatch):
+    _setup_cache(monkeypatch)
+    album_path = Path("/album")
+    fs.create_file(album_path / "01.flac")
+    fs.create_file(album_path / "02.flac")
+    fs.create_file(album_path / "Album.cue", contents = 'FILE "01.flac" WAVE\r\n  TRACK 01 AUDIO\r\nFILE "02.flac" WAVE\r\n  TRACK 02 AUDIO\r\n')
+    fs.create_file(album_path / "Album.log")
+    assert(not is_audio_image_album(album_path))
+    beautify_album_folder(album_path)
+    assert(sorted(path.name for path in album_path.iterdir()) == ["01.flac", "02.flac", "Misc"])
+    assert(sorted(path.name for path in (album_path / "Misc").iterdir()) == ["Album.cue", "Album.log"])
+
+def test_beautify_misc_keeps_the_audio_image(fs, monkeypatch):
+    _setup_cache(monkeypatch)
+    album_path = Path("/album")
+    fs.create_file(album_path / "CDImage.flac")
+    fs.create_file(album_path / "Artist - Album.cue", contents = _cue_sheet.format("CDImage.wav"))
+    fs.create_file(album_path / "info.txt")
+    fs.create_file(album_path / "cover.jpg")
+    fs.create_file(album_path / "extras" / "notes.txt")
+    assert(not is_misc_file(album_path / "Artist - Album.cue", True))
+    assert(is_misc_file(album_path / "info.txt", True))
+    beautify_misc(album_path)
+    assert(sorted(path.name for path in album_path.iterdir()) == ["Artist - Album.cue", "CDImage.flac", "Misc", "cover.jpg"])
+    assert(sorted(path.name for path in (album_path / "Misc").iterdir()) == ["extras", "info.txt"])
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+import dedup
+import mover
+from dedup import Deduplicator
+from dedup import HashCache
+from dedup import duplicate_groups
+from main import AlbumSnapshot
+from main import beautify_album_folder
+from main import plan_album_folder
+from plan import AlbumPlan
+from plan import Operation
+from plan import apply_plan
+
+_album_files = {"t1.flac": "t1", "cover.jpg": "front", "Scans/cover.jpg": "front", "Scans/Booklet/cover.jpg": "other", "Scans/back.jpg": "back!"}
+
+def test_duplicate_groups_hash_only_same_sizes(fs, monkeypatch):
+    folder = Path("/artwork")
+    fs.create_file(folder / "a.jpg", contents = "12345")
+    fs.create_file(folder / "a (1).jpg", contents = "12345")
+    fs.create_file(folder / "b.jpg", contents = "12346")
+    fs.create_file(folder / "c.jpg", contents = "123")
+    hashed = []
+    file_hash = mover.file_hash
+    monkeypatch.setattr(mover, "file_hash", lambda path: hashed.append(path) or file_hash(path))
+    hash_cache = HashCache()
+    groups = duplicate_groups(sorted(folder.iterdir()), hash_cache)
+    assert(groups == [[folder / "a.jpg", folder / "a (1).jpg"]])
+    assert(len(hashed) == 3)
+    duplicate_groups(sorted(folder.iterdir()), hash_cache)
+    assert(len(hashed) == 3)
+
+def test_hash_cache_survives_renames_and_saves(fs):
+    fs.create_file("/library/a.jpg", contents = "12345")
+    hash_cache = dedup.library_hash_cache(Path("/library"))
+    digest = hash_cache.file_hash(Path("/library/a.jpg"), os.stat("/library/a.jpg"))
+    os.rename("/library/a.jpg", "/library/b.jpg")
+    hash_cache.save()
+    loaded = dedup.library_hash_cache(Path("/library"))
+    assert(len(loaded) == 1)
+    assert(loaded.file_hash(Path("/missing.jpg"), os.stat("/library/b.jpg")) == digest)
+
+def test_beautify_album_folder_drops_duplicate_artwork(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path, _album_files)
+    dedup.configure()
+    try:
+        beautify_album_folder(album_path)
+    finally:
+        dedup.disable()
+    assert(sorted(path.name for path in (album_path / "Artwork").iterdir()) == ["back.jpg", "cover (1).jpg", "cover.jpg"])
+    assert((album_path / "Artwork" / "cover (1).jpg").read_text() == "other")
+
+def test_duplicates_in_one_folder_are_dropped_even_with_hard_links(fs):
+    folder = Path("/artwork")
+    fs.create_file(folder / "a.jpg", contents = "12345")
+    fs.create_file(folder / "a (1).jpg", contents = "12345")
+    assert(Deduplicator(hard_link = True).deduplicate_folder(folder, AlbumSnapshot(folder)) == 1)
+    assert(sorted(path.name for path in folder.iterdir()) == ["a.jpg"])
+
+def test_hard_links_across_destination_folders(fs):
+    fs.create_file("/library/album1/cover.jpg", contents = "12345")
+    fs.create_file("/library/album2/cover.jpg", contents = "12345")
+    files = [Path("/library/album1/cover.jpg"), Path("/library/album2/cover.jpg")]
+    plan = AlbumPlan(Path("/library"))
+    assert(Deduplicator(hard_link = True).deduplicate(files, AlbumSnapshot(Path("/library"), plan)) == 1)
+    assert(plan.operations == [Operation(Operation.LINK, files[0], files[1])])
+    apply_plan([plan])
+    assert(os.stat(files[0]).st_ino == os.stat(files[1]).st_ino)
+
+def test_hard_link_mode_drops_artwork_bound_for_the_same_folder(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path, _album_files)
+    dedup.configure(hard_link = True)
+    try:
+        plan = plan_album_folder(album_path)
+        beautify_album_folder(album_path)
+    finally:
+        dedup.disable()
+    assert(plan.operations[0] == Operation(Operation.UNLINK, album_path / "Scans" / "cover.jpg"))
+    artwork_path = album_path / "Artwork"
+    assert(sorted(path.name for path in artwork_path.iterdir()) == ["back.jpg", "cover (1).jpg", "cover.jpg"])
+    assert(os.stat(artwork_path / "cover.jpg").st_nlink == 1)
+    assert((artwork_path / "cover (1).jpg").read_text() == "other")
@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+import instrumentation
+from main import beautify_album_folder
+from main import beautify_library
+from main import main
+from main import plan_album_folder
+
+def test_disabled_instrumentation_is_a_no_op(fs):
+    instrumentation.disable()
+    with instrumentation.stage("stage", "album") as stage:
+        instrumentation.count("stat")
+    assert(stage is instrumentation.stage("other"))
+    assert(instrumentation.recorder() is None)
+
+def test_recorder_collects_stage_counters(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path)
+    events = []
+    recorder = instrumentation.enable(instrumentation.Recorder([events.append]))
+    try:
+        beautify_album_folder(album_path)
+    finally:
+        instrumentation.disable()
+    assert([event["event"] for event in events if "album" in event][0] == "album_started")
+    assert(events[-1]["event"] == "album_finished")
+    assert(recorder.stage_totals["route_album_files"].counters["rename"] == 2)
+    assert(recorder.stage_totals["route_album_files"].counters["mkdir"] == 2)
+    assert(recorder.stage_totals["route_album_files"].counters["unlink"] == 1)
+    assert(recorder.stage_totals["remove_folders_wo_files_recursively"].counters["rmdir"] == 1)
+    assert(recorder.album_totals == {})
+    assert([album for album, _ in recorder.slowest()] == [str(album_path)])
+    assert("route_album_files" in recorder.summary())
+
+def test_discovery_stage_and_json_lines(fs, create_album):
+    library_path = Path("/library")
+    create_album(library_path / "album1")
+    create_album(library_path / "album2")
+    sink = instrumentation.JsonLinesSink("/events.jsonl")
+    recorder = instrumentation.enable(instrumentation.Recorder([sink]))
+    try:
+        beautify_library(library_path)
+    finally:
+        instrumentation.disable()
+        sink.close()
+    assert(recorder.stage_totals["discovery"].counters["listdir"] >= 5)
+    with open("/events.jsonl", encoding = "utf-8") as file:
+        events = [json.loads(line) for line in file]
+    assert(sum(1 for event in events if event["event"] == "album_finished") == 2)
+
+def test_only_the_slowest_albums_are_kept(fs, create_album):
+    library_path = Path("/library")
+    for index in range(5):
+        create_album(library_path / ("album" + str(index)))
+    recorder = instrumentation.enable(instrumentation.Recorder(slowest_albums = 2))
+    try:
+        beautify_library(library_path)
+        # Planning sends no album events; the next album's stages finish the one before.
+        for index in range(5):
+            plan_album_folder(library_path / ("album" + str(index)))
+    finally:
+        instrumentation.disable()
+    assert(len(recorder.album_totals) <= 1)
+    assert(len(recorder._slowest) == 2)
+    assert(len(recorder.slowest()) == 2)
+
+def test_progress_is_printed_without_a_recorder(fs, capsys, monkeypatch, create_album):
+    create_album(Path("/library/album"))
+    monkeypatch.setattr(instrumentation, "Recorder", None)
+    assert(main(["/library"]) == 0)
+    assert("Beautifying: " + str(Path("/library/album")) in capsys.readouterr().out)
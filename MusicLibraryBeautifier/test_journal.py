@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import instrumentation
+from journal import Journal
+from journal import is_applied
+from main import beautify_library
+from main import plan_album_folder
+from main import _temp_folder_suffix
+from plan import Operation
+from plan import PlanApplier
+
+_extra_files = {"artwork/front.jpg": "front", "scans/back.jpg": "back"}
+
+def _tree(path: Path):
+    return sorted(str(item.relative_to(path)) for item in path.rglob("*"))
+
+def test_resume_finishes_an_interrupted_album(fs, create_album):
+    create_album(Path("/expected/album"), extra_files = _extra_files)
+    beautify_library(Path("/expected"))
+    album_path = Path("/library/album")
+    create_album(album_path, extra_files = _extra_files)
+    plan = plan_album_folder(album_path)
+    journal = Journal(Path("/library/journal.jsonl"))
+    journal.begin(plan)
+    applier = PlanApplier()
+    applier.apply_operation(plan.operations[0])
+    # Killed between the two renames of the artwork folder, before its progress was recorded.
+    journal.close()
+    assert((album_path / ("Artwork" + _temp_folder_suffix)).exists())
+
+    journal = Journal(Path("/library/journal.jsonl"))
+    assert(journal.incomplete_albums()[0].operations == plan.operations)
+    assert(journal.resume() == [album_path])
+    assert(journal.is_finished(album_path))
+    assert(_tree(album_path) == _tree(Path("/expected/album")))
+
+def test_finished_albums_are_skipped(fs, create_album):
+    create_album(Path("/library/album1"), extra_files = _extra_files)
+    create_album(Path("/library/album2"), extra_files = _extra_files)
+    journal = Journal(Path("/journal.jsonl"))
+    journal.apply_album(plan_album_folder(Path("/library/album1")), PlanApplier())
+    journal.close()
+    fs.create_file("/library/album1/late.txt")
+    report = beautify_library(Path("/library"), journal = Journal(Path("/journal.jsonl")))
+    assert(report.beautified == [Path("/library/album2")])
+    assert(Path("/library/album1/late.txt").exists())
+    assert(Path("/library/album2/Misc/notes.txt").exists())
+
+def test_torn_record_is_ignored(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path, extra_files = _extra_files)
+    journal = Journal(Path("/journal.jsonl"))
+    journal.apply_album(plan_album_folder(album_path), PlanApplier())
+    journal.close()
+    with open("/journal.jsonl", "a") as file:
+        file.write('{"album": "/library/other", "operat')
+    journal = Journal(Path("/journal.jsonl"))
+    assert(journal.is_finished(album_path))
+    assert(journal.incomplete_albums() == [])
+
+def test_records_after_two_crashes_in_a_row_are_read(fs, create_album):
+    create_album(Path("/library/album1"), extra_files = _extra_files)
+    create_album(Path("/library/album2"), extra_files = _extra_files)
+    journal = Journal(Path("/journal.jsonl"))
+    journal.apply_album(plan_album_folder(Path("/library/album1")), PlanApplier())
+    journal.close()
+    with open("/journal.jsonl", "a") as file:
+        file.write('{"album": "/library/other", "operat')
+    plan = plan_album_folder(Path("/library/album2"))
+    journal = Journal(Path("/journal.jsonl"))
+    journal.begin(plan)
+    PlanApplier().apply_operation(plan.operations[0])
+    journal.applied(plan, 1)
+    journal.close()
+    with open("/journal.jsonl", "a") as file:
+        file.write('{"album": "/library/album2", "app')
+    journal = Journal(Path("/journal.jsonl"))
+    assert(journal.is_finished(Path("/library/album1")))
+    assert([album_plan.path for album_plan in journal.incomplete_albums()] == [plan.path])
+    assert(journal.resume() == [plan.path])
+    assert(Path("/library/album2/Misc/notes.txt").exists())
+
+def test_fsyncs_are_batched(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path, extra_files = _extra_files)
+    plan = plan_album_folder(album_path)
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("apply"):
+            journal = Journal(Path("/journal.jsonl"), sync_interval = 1000)
+            journal.apply_album(plan, PlanApplier())
+            journal.close()
+    finally:
+        instrumentation.disable()
+    assert(len(plan.operations) > 5)
+    assert(recorder.stage_totals["apply"].counters["fsync"] == 2)
+
+def test_is_applied(fs):
+    fs.create_file("/album/a.txt")
+    fs.create_dir("/album/folder")
+    assert(is_applied(Operation(Operation.MKDIR, Path("/album/folder"))))
+    assert(not is_applied(Operation(Operation.MOVE, Path("/album/a.txt"), Path("/album/folder/a.txt"))))
+    assert(is_applied(Operation(Operation.MOVE, Path("/album/b.txt"), Path("/album/folder/b.txt"))))
+    assert(not is_applied(Operation(Operation.UNLINK, Path("/album/a.txt"))))
+    assert(is_applied(Operation(Operation.RMDIR, Path("/album/other"))))
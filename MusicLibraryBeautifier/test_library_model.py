@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import instrumentation
+from library_model import DirectoryNode
+from library_model import iter_album_nodes
+from library_model import iter_album_plans
+from library_model import scan_library
+from main import FileKind
+from main import iter_deepest_audio_folders
+from main import plan_album_folder
+from plan import apply_plan
+
+def _create_library(fs):
+    fs.create_file("/library/artist/album1/t1.flac", contents = "1234")
+    fs.create_file("/library/artist/album1/t1.m3u")
+    fs.create_file("/library/artist/album1/notes.txt")
+    fs.create_file("/library/artist/album1/scans/front.jpg")
+    fs.create_file("/library/artist/album2/CD1/t1.mp3")
+    fs.create_file("/library/artist/album2/CD2/t1.mp3")
+    fs.create_file("/library/artist/album2/cover.jpg")
+    fs.create_dir("/library/empty")
+
+def test_scan_library(fs):
+    _create_library(fs)
+    root = scan_library(Path("/library"))
+    album = root.directories[0].directories[0]
+    assert(album.path() == Path("/library/artist/album1"))
+    assert(album.file_names() == ["t1.flac", "t1.m3u", "notes.txt"])
+    assert(list(album.file_kinds) == [FileKind.AUDIO, FileKind.PLAYLIST, FileKind.OTHER])
+    assert(album.file_sizes[0] == 4)
+    assert(sum(node.file_count() for node in root.iter_nodes()) == 7)
+    assert(DirectoryNode("scans").name is album.directories[0].name)
+
+def test_discovery_matches_disk(fs):
+    _create_library(fs)
+    root = scan_library(Path("/library"), with_stats = False)
+    assert(sorted(node.path() for node in iter_album_nodes(root)) == sorted(iter_deepest_audio_folders(Path("/library"))))
+
+def test_plans_from_model_match_disk_plans_without_listing(fs):
+    _create_library(fs)
+    root = scan_library(Path("/library"))
+    # Listing order is up to the filesystem, so operations are compared regardless of their order.
+    expected = [sorted(map(repr, plan_album_folder(node.path()).operations)) for node in iter_album_nodes(root)]
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("plan"):
+            plans = list(iter_album_plans(root))
+    finally:
+        instrumentation.disable()
+    assert([sorted(map(repr, plan.operations)) for plan in plans] == expected)
+    assert("listdir" not in recorder.stage_totals["plan"].counters)
+    apply_plan(plans)
+    assert(Path("/library/artist/album1/Artwork/front.jpg").exists())
+    assert(Path("/library/artist/album2/CD 1/t1.mp3").exists())
@@ -1,3 +1,5 @@
+import os
+import pickle
 from pathlib import Path
 from pyfakefs.fake_filesystem_unittest import TestCase
 
@@ -11,9 +13,30 @@ from main import move_misc_files_into_folder
 from main import is_audio_file
 from main import remove_folders_wo_files_recursively
 from main import remove_files
+from main import remove_files_and_empty_folders
+from main import prune_empty_folders
+from main import route_album_files
+from main import default_routing_rules
+from main import Destination
 from main import _m3u_regex
+from main import _temp_folder_suffix
 from main import beautify_album_folder
+from main import is_canonical_album
+from main import plan_album_folder
 from main import move_and_rename_if_exists
+from main import iter_deepest_audio_folders
+from main import disc_number
+from main import AlbumSnapshot
+from main import StemIndex
+from main import beautify_library
+from main import _initialize_worker_process
+from main import file_kind
+from main import FileKind
+from main import is_cue_file
+from main import is_log_file
+import main
+import instrumentation
+import mover
 
 class FakeFileSystemTests(TestCase):
     def setUp(self):
@@ -36,6 +59,18 @@ def test_is_not_audio_file(fs):
     assert(not is_audio_file(Path("track.m3u")))
     assert(not is_audio_file(Path("track.m3u8")))
 
+def test_file_kind(fs):
+    assert(file_kind(Path("track.flac")) == FileKind.AUDIO)
+    assert(file_kind(Path("TRACK.APE")) == FileKind.AUDIO)
+    assert(file_kind(Path("Front.JPG")) == FileKind.IMAGE)
+    assert(file_kind(Path("album.m3u8")) == FileKind.PLAYLIST)
+    assert(file_kind(Path("album.txt")) == FileKind.OTHER)
+    assert(file_kind(Path(".accurip")) == FileKind.OTHER)
+    assert(file_kind(Path("file")) == FileKind.OTHER)
+    assert(is_cue_file(Path("album.CUE")))
+    assert(is_log_file(Path("album.Log")))
+    assert(is_audio_file(Path("track.WV")))
+
 def test_ensure_folder_exists_creation(fs):
     path = Path("/root")
     assert not path.exists()
@@ -165,6 +200,42 @@ def test_is_not_audio_image_file_single_file(fs):
     assert(not is_audio_image_file(source_path / "track1.flac"))
 
 
+def test_is_audio_image_file_case_insensitive(fs):
+    source_path = Path("/root/folder")
+    fs.create_file(source_path / "Album.FLAC")
+    fs.create_file(source_path / "album.cue")
+    fs.create_file(source_path / "other.log")
+    assert(is_audio_image_file(source_path / "Album.FLAC"))
+    assert(is_audio_image_file(source_path / "album.cue"))
+    assert(not is_audio_image_file(source_path / "other.log"))
+
+def test_audio_image_pairing_follows_snapshot_moves(fs):
+    source_path = Path("/root/folder")
+    fs.create_file(source_path / "album.ape")
+    fs.create_file(source_path / "album.cue")
+    snapshot = AlbumSnapshot(source_path)
+    assert(is_audio_image_file(source_path / "album.cue", snapshot))
+    move_and_rename_if_exists(source_path / "album.ape", source_path / "Misc", snapshot)
+    assert(not is_audio_image_file(source_path / "album.cue", snapshot))
+    assert(not is_audio_image_file(source_path / "Misc" / "album.ape", snapshot))
+    move_and_rename_if_exists(source_path / "album.cue", source_path / "Misc", snapshot)
+    assert(is_audio_image_file(source_path / "Misc" / "album.ape", snapshot))
+
+def test_stem_index(fs):
+    index = StemIndex(["Album.flac", "album.cue", "Album.log", "notes.txt"])
+    assert(index.kinds("ALBUM") == {FileKind.AUDIO, FileKind.CUE, FileKind.LOG})
+    assert(index.kinds_of("album.jpg") == index.kinds("album"))
+    assert(index.names("album", FileKind.AUDIO) == ["Album.flac"])
+    assert(index.kinds("cover") == set())
+    source_path = Path("/root/folder")
+    fs.create_file(source_path / "album.ape")
+    fs.create_file(source_path / "album.cue")
+    snapshot = AlbumSnapshot(source_path)
+    assert(snapshot.stem_index(source_path).kinds("album") == {FileKind.AUDIO, FileKind.CUE})
+    move_and_rename_if_exists(source_path / "album.ape", source_path / "Misc", snapshot)
+    assert(snapshot.stem_index(source_path).kinds("album") == {FileKind.CUE})
+    assert(snapshot.stem_index(source_path / "Misc").kinds("album") == {FileKind.AUDIO})
+
 def test_is_deepest_audio_folder_top_audio_folder(fs):
     source_path = Path("/root/album")
     fs.create_file(source_path / "album.wv")
@@ -183,6 +254,28 @@ def test_is_deepest_audio_folder_not_deepest_folder(fs):
     fs.create_file(source_path / "folder" / "folder2" / "album.mp3")
     assert(not is_deepest_audio_folder(source_path))
 
+def test_iter_deepest_audio_folders(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist1" / "album1" / "t1.mp3")
+    fs.create_file(library_path / "artist1" / "album1" / "covers" / "front.jpg")
+    fs.create_file(library_path / "artist1" / "album2" / "t1.wv")
+    fs.create_file(library_path / "artist1" / "album2" / "CD 1" / "t1.mp3")
+    fs.create_file(library_path / "artist1" / "album2" / "CD 2" / "t1.mp3")
+    fs.create_file(library_path / "artist2" / "notes.txt")
+    fs.create_dir(library_path / "empty")
+    folders = set(iter_deepest_audio_folders(library_path))
+    assert(folders == {library_path / "artist1" / "album1",
+                       library_path / "artist1" / "album2" / "CD 1",
+                       library_path / "artist1" / "album2" / "CD 2"})
+    for folder in folders:
+        assert(is_deepest_audio_folder(folder))
+
+def test_iter_deepest_audio_folders_root_album(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "t1.ape")
+    assert(list(iter_deepest_audio_folders(library_path)) == [library_path])
+    assert(list(iter_deepest_audio_folders(library_path / "missing")) == [])
+
 def test_move_misc_files_into_folder(fs):
     source_path = Path("/root/album")
     misc_path = source_path / "Misc"
@@ -320,6 +413,30 @@ def test_move_and_rename_if_exists_folder_exists(fs):
     assert((target_folder_path / "target (1)" / "t.txt").exists())
     assert(not source_path.exists())
 
+def test_move_and_rename_if_exists_many_collisions(fs):
+    source_path = Path("/root/album")
+    target_folder_path = source_path / "Artwork"
+    for folder in ["a", "b", "c", "d", "e"]:
+        fs.create_file(source_path / folder / "cover.jpg")
+    fs.create_file(target_folder_path / "cover (2).jpg")
+    snapshot = AlbumSnapshot(source_path)
+    for folder in ["a", "b", "c", "d", "e"]:
+        move_and_rename_if_exists(source_path / folder / "cover.jpg", target_folder_path, snapshot)
+    for name in ["cover.jpg", "cover (1).jpg", "cover (2).jpg", "cover (3).jpg", "cover (4).jpg", "cover (5).jpg"]:
+        assert((target_folder_path / name).exists())
+
+def test_move_and_rename_if_exists_falls_back_to_uuid(fs, monkeypatch):
+    monkeypatch.setattr(main, "_maximum_item_suffix", 1)
+    target_folder_path = Path("/root/folder")
+    fs.create_file(target_folder_path / "t.txt")
+    fs.create_file(target_folder_path / "t (1).txt")
+    fs.create_file(Path("/root/t.txt"))
+    move_and_rename_if_exists(Path("/root/t.txt"), target_folder_path)
+    assert(not Path("/root/t.txt").exists())
+    names = [entry.name for entry in target_folder_path.iterdir()]
+    assert(len(names) == 3)
+    assert(all(name.endswith(".txt") for name in names))
+
 def test_beautify_album_folder_already_beautified_single_audiofile(fs):
     source_path = Path("C:/root/album")
     fs.create_file(source_path / "t1.mp3")
@@ -445,3 +562,223 @@ def test_beautify_album_folder_general_with_m3u8(fs):
     assert((source_path / "Misc" / "t1 2.cue").exists())
     assert((source_path / "Misc" / "t1.log").exists())
 
+def test_beautify_album_folder_deletes_every_playlist_kind(fs):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "track1.flac")
+    fs.create_file(source_path / "album.pls")
+    fs.create_file(source_path / "album.M3U")
+    fs.create_file(source_path / "playlists.m3u" / "notes.txt")
+    beautify_album_folder(source_path)
+    assert(sorted(path.name for path in source_path.iterdir()) == ["Misc", "track1.flac"])
+    assert((source_path / "Misc" / "playlists.m3u" / "notes.txt").exists())
+
+
+def test_album_snapshot_tracks_moves(fs):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.mp3", contents = "1234")
+    fs.create_file(source_path / "scans" / "front.jpg")
+    snapshot = AlbumSnapshot(source_path)
+    assert(snapshot.is_file(source_path / "t1.mp3"))
+    assert(snapshot.size(source_path / "t1.mp3") == 4)
+    assert(snapshot.is_dir(source_path / "scans"))
+    assert(set(snapshot.rglob(source_path)) == {source_path / "t1.mp3", source_path / "scans", source_path / "scans" / "front.jpg"})
+
+    move_and_rename_if_exists(source_path / "scans", source_path / "Misc", snapshot)
+    assert(not snapshot.exists(source_path / "scans"))
+    assert(snapshot.is_file(source_path / "Misc" / "scans" / "front.jpg"))
+    remove_files(source_path, r"\.mp3$", snapshot)
+    assert(not snapshot.exists(source_path / "t1.mp3"))
+    assert(not (source_path / "t1.mp3").exists())
+
+def test_album_snapshot_lists_each_folder_once(fs, count_listings):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.ape")
+    fs.create_file(source_path / "t1.cue")
+    fs.create_file(source_path / "notes.txt")
+    fs.create_file(source_path / "scans" / "front.jpg")
+    fs.create_file(source_path / "scans" / "back.jpg")
+    snapshot = AlbumSnapshot(source_path)
+    listed_folders = count_listings(snapshot)
+    move_files_into_folder(source_path, source_path / "Artwork", is_image_file, snapshot)
+    move_misc_files_into_folder(source_path, source_path / "Misc", snapshot)
+    remove_folders_wo_files_recursively(source_path, snapshot)
+    assert(len(listed_folders) == len(set(listed_folders)))
+    assert((source_path / "Artwork" / "front.jpg").exists())
+    assert((source_path / "Misc" / "notes.txt").exists())
+    assert(not (source_path / "scans").exists())
+
+def test_beautify_library_parallel(fs):
+    library_path = Path("/library")
+    for album in ["album1", "album2", "album3", "album4", "album5"]:
+        fs.create_file(library_path / "artist" / album / "t1.mp3")
+        fs.create_file(library_path / "artist" / album / "front.jpg")
+        fs.create_file(library_path / "artist" / album / "notes.txt")
+    report = beautify_library(library_path, jobs = 3)
+    assert(len(report.beautified) == 5)
+    assert(not report.errors)
+    for album in ["album1", "album2", "album3", "album4", "album5"]:
+        assert((library_path / "artist" / album / "Artwork" / "front.jpg").exists())
+        assert((library_path / "artist" / album / "Misc" / "notes.txt").exists())
+
+def test_beautify_library_collects_errors(fs, monkeypatch):
+    library_path = Path("/library")
+    fs.create_file(library_path / "album1" / "t1.mp3")
+    fs.create_file(library_path / "album2" / "t1.mp3")
+    beautify = main.beautify_album_folder
+    def failing_beautify(path):
+        if path.name == "album2":
+            raise RuntimeError("broken album")
+        beautify(path)
+    monkeypatch.setattr(main, "beautify_album_folder", failing_beautify)
+    report = beautify_library(library_path, jobs = 2)
+    assert(report.beautified == [library_path / "album1"])
+    assert(list(report.errors) == [library_path / "album2"])
+
+def test_remove_files_and_empty_folders_lists_each_folder_once(fs, count_listings):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.mp3")
+    fs.create_file(source_path / "a.m3u")
+    fs.create_file(source_path / "f1" / "f2" / "b.m3u8")
+    fs.create_dir(source_path / "f1" / "f3")
+    fs.create_file(source_path / "f4" / "q.txt")
+    snapshot = AlbumSnapshot(source_path)
+    listed_folders = count_listings(snapshot)
+    remove_files_and_empty_folders(source_path, _m3u_regex, snapshot)
+    assert(sorted(listed_folders) == sorted([source_path, source_path / "f1", source_path / "f1" / "f2", source_path / "f1" / "f3", source_path / "f4"]))
+    assert(not (source_path / "a.m3u").exists())
+    assert(not (source_path / "f1").exists())
+    assert((source_path / "t1.mp3").exists())
+    assert((source_path / "f4" / "q.txt").exists())
+
+def test_prune_empty_folders(fs):
+    library_path = Path("/library")
+    fs.create_dir(library_path / "artist1" / "album1" / "Misc")
+    fs.create_dir(library_path / "artist2")
+    fs.create_file(library_path / "artist3" / "album3" / "t1.mp3")
+    fs.create_dir(library_path / "artist3" / "album4" / "CD1")
+    prune_empty_folders(library_path)
+    assert(library_path.exists())
+    assert(sorted(path.name for path in library_path.iterdir()) == ["artist3"])
+    assert(sorted(path.name for path in (library_path / "artist3").iterdir()) == ["album3"])
+
+def test_route_album_files_lists_each_folder_once(fs, count_listings):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.ape")
+    fs.create_file(source_path / "t1.cue")
+    fs.create_file(source_path / "notes.txt")
+    fs.create_file(source_path / "t1.m3u")
+    fs.create_file(source_path / "cover.jpg")
+    fs.create_file(source_path / "scans" / "cover.jpg")
+    fs.create_file(source_path / "scans" / "booklet.pdf")
+    snapshot = AlbumSnapshot(source_path)
+    listed_folders = count_listings(snapshot)
+    route_album_files(source_path, default_routing_rules(), snapshot)
+    assert(len(listed_folders) == len(set(listed_folders)))
+    assert((source_path / "t1.ape").exists())
+    assert((source_path / "t1.cue").exists())
+    assert(not (source_path / "t1.m3u").exists())
+    assert((source_path / "Artwork" / "cover.jpg").exists())
+    assert((source_path / "Artwork" / "cover (1).jpg").exists())
+    assert((source_path / "Misc" / "notes.txt").exists())
+    assert((source_path / "Misc" / "scans" / "booklet.pdf").exists())
+
+def test_route_album_files_custom_destination(fs):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.flac")
+    fs.create_file(source_path / "rip.log")
+    fs.create_file(source_path / "notes.txt")
+    rules = [(Destination.STAY, lambda item: item.kind == FileKind.AUDIO), ("Logs", lambda item: item.kind == FileKind.LOG)]
+    route_album_files(source_path, rules)
+    assert((source_path / "Logs" / "rip.log").exists())
+    assert((source_path / "notes.txt").exists())
+    assert((source_path / "t1.flac").exists())
+
+def test_beautify_album_folder_recovers_stranded_temp_folder(fs):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.flac")
+    fs.create_file(source_path / ("Artwork" + _temp_folder_suffix) / "front.jpg")
+    beautify_album_folder(source_path)
+    assert(sorted(path.name for path in source_path.iterdir()) == ["Artwork", "t1.flac"])
+    assert((source_path / "Artwork" / "front.jpg").exists())
+
+def test_tidy_album_is_not_written_to(fs, monkeypatch):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.flac")
+    fs.create_file(source_path / "artwork" / "front.jpg")
+    fs.create_file(source_path / "notes.txt")
+    assert(not is_canonical_album(source_path))
+    beautify_album_folder(source_path)
+    assert(sorted(path.name for path in source_path.iterdir()) == ["Artwork", "Misc", "t1.flac"])
+    assert(is_canonical_album(source_path))
+    def fail(*args, **kwargs):
+        raise AssertionError("written to a tidy album")
+    for name in ["rename", "replace", "mkdir", "rmdir", "unlink"]:
+        monkeypatch.setattr(os, name, fail)
+    beautify_album_folder(source_path)
+
+def test_album_without_misc_files_gets_no_misc_folder(fs):
+    source_path = Path("/root/album")
+    fs.create_file(source_path / "t1.flac")
+    fs.create_file(source_path / "front.jpg")
+    beautify_album_folder(source_path)
+    assert(sorted(path.name for path in source_path.iterdir()) == ["Artwork", "t1.flac"])
+
+def test_disc_number():
+    assert(disc_number("CD1") == 1)
+    assert(disc_number("Disc 02") == 2)
+    assert(disc_number("[CD 3]") == 3)
+    assert(disc_number("(disk 4)") == 4)
+    assert(disc_number("CD1 bonus") is None)
+    assert(disc_number("Scans") is None)
+
+def test_iter_deepest_audio_folders_disc_set(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist" / "album" / "CD1" / "t1.flac")
+    fs.create_file(library_path / "artist" / "album" / "Disc 2" / "t1.flac")
+    fs.create_file(library_path / "artist" / "album" / "[CD 3]" / "t1.flac")
+    fs.create_file(library_path / "artist" / "album" / "[CD 3]" / "scans" / "back.jpg")
+    assert(list(iter_deepest_audio_folders(library_path)) == [library_path / "artist" / "album"])
+
+def test_beautify_album_folder_disc_set(fs):
+    album_path = Path("/root/album")
+    fs.create_file(album_path / "CD1" / "t1.flac")
+    fs.create_file(album_path / "CD1" / "t1.m3u")
+    fs.create_file(album_path / "CD1" / "notes.txt")
+    fs.create_file(album_path / "CD1" / "rip.log")
+    fs.create_file(album_path / "Disc 2" / "t1.flac")
+    fs.create_file(album_path / "Disc 2" / "rip.log")
+    fs.create_file(album_path / "Disc 2" / "scans" / "back.jpg")
+    fs.create_file(album_path / "front.jpg")
+    beautify_album_folder(album_path)
+    assert(sorted(path.name for path in album_path.iterdir()) == ["Artwork", "CD 1", "CD 2", "Misc"])
+    assert(sorted(path.name for path in (album_path / "CD 1").iterdir()) == ["t1.flac"])
+    assert(sorted(path.name for path in (album_path / "CD 2").iterdir()) == ["t1.flac"])
+    assert((album_path / "Artwork" / "front.jpg").exists())
+    assert((album_path / "Artwork" / "back.jpg").exists())
+    assert(sorted(path.name for path in (album_path / "Misc").iterdir()) == ["CD 1", "CD 2"])
+    assert(sorted(path.name for path in (album_path / "Misc" / "CD 1").iterdir()) == ["notes.txt", "rip.log"])
+    assert(sorted(path.name for path in (album_path / "Misc" / "CD 2").iterdir()) == ["rip.log"])
+    assert(is_canonical_album(album_path))
+
+def test_emptied_folders_are_removed_in_place(fs):
+    album_path = Path("/root/album")
+    fs.create_file(album_path / "t1.flac")
+    fs.create_file(album_path / "scans" / "front.jpg")
+    fs.create_dir(album_path / "old")
+    operations = [(operation.kind, operation.source.name) for operation in plan_album_folder(album_path).operations]
+    assert(sorted(operations) == [("mkdir", "Artwork"), ("move", "front.jpg"), ("rmdir", "old"), ("rmdir", "scans")])
+    beautify_album_folder(album_path)
+    assert(sorted(path.name for path in album_path.iterdir()) == ["Artwork", "t1.flac"])
+
+def test_worker_processes_get_the_move_settings():
+    engine = mover.default_engine()
+    try:
+        options = pickle.loads(pickle.dumps(mover.configure(buffer_size = 1024, fsync = True, progress = mover.ConsoleProgress()).options()))
+        mover.configure()
+        _initialize_worker_process(options)
+        assert(mover.default_engine().buffer_size == 1024)
+        assert(mover.default_engine().fsync)
+        assert(isinstance(mover.default_engine().progress, mover.ConsoleProgress))
+    finally:
+        instrumentation.disable()
+        mover._default_engine = engine
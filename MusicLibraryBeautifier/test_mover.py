@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import instrumentation
+import mover
+from mover import MoveEngine
+from mover import partial_path
+
+def _recorded_move(engine: MoveEngine, source_path: Path, target_path: Path):
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("move"):
+            engine.move(source_path, target_path)
+    finally:
+        instrumentation.disable()
+    return recorder.stage_totals["move"].counters
+
+def test_move_on_same_device_renames(fs):
+    fs.create_file("/library/album/t1.flac", contents = "audio")
+    counters = _recorded_move(MoveEngine(), Path("/library/album/t1.flac"), Path("/library/t1.flac"))
+    assert(counters["rename"] == 1)
+    assert("bytes_copied" not in counters)
+    assert(Path("/library/t1.flac").read_text() == "audio")
+
+def test_move_across_devices_copies_and_verifies(fs):
+    fs.add_mount_point("/other")
+    fs.create_file("/library/t1.flac", contents = "0123456789" * 100)
+    counters = _recorded_move(MoveEngine(buffer_size = 64), Path("/library/t1.flac"), Path("/other/t1.flac"))
+    assert("rename" not in counters)
+    assert(counters["bytes_copied"] == 1000)
+    assert(Path("/other/t1.flac").read_text() == "0123456789" * 100)
+    assert(not Path("/library/t1.flac").exists())
+    assert(not partial_path(Path("/other/t1.flac")).exists())
+
+def test_move_across_devices_resumes_partial_copy(fs):
+    fs.add_mount_point("/other")
+    fs.create_file("/library/t1.flac", contents = "0123456789" * 100)
+    fs.create_file("/other/t1.flac.partial", contents = "0123456789" * 40)
+    counters = _recorded_move(MoveEngine(), Path("/library/t1.flac"), Path("/other/t1.flac"))
+    assert(counters["bytes_copied"] == 600)
+    assert(Path("/other/t1.flac").read_text() == "0123456789" * 100)
+
+def test_move_across_devices_recopies_corrupted_partial(fs):
+    fs.add_mount_point("/other")
+    fs.create_file("/library/t1.flac", contents = "0123456789" * 100)
+    fs.create_file("/other/t1.flac.partial", contents = "x" * 400)
+    _recorded_move(MoveEngine(), Path("/library/t1.flac"), Path("/other/t1.flac"))
+    assert(Path("/other/t1.flac").read_text() == "0123456789" * 100)
+    assert(not Path("/library/t1.flac").exists())
+
+def test_move_folder_across_devices(fs):
+    fs.add_mount_point("/other")
+    fs.create_file("/library/scans/front.jpg", contents = "front")
+    fs.create_file("/library/scans/booklet/page1.jpg", contents = "page")
+    MoveEngine().move(Path("/library/scans"), Path("/other/scans"))
+    assert(Path("/other/scans/front.jpg").read_text() == "front")
+    assert(Path("/other/scans/booklet/page1.jpg").read_text() == "page")
+    assert(not Path("/library/scans").exists())
+
+def test_copy_file_on_real_filesystem(tmp_path):
+    source_path = tmp_path / "source.bin"
+    source_path.write_bytes(bytes(range(256)) * 1000)
+    copied = MoveEngine(buffer_size = 4096).copy_file(source_path, tmp_path / "target.bin")
+    assert(copied == 256000)
+    assert((tmp_path / "target.bin").read_bytes() == source_path.read_bytes())
+
+def test_device_cache_is_bounded(fs, monkeypatch):
+    monkeypatch.setattr(mover, "_cached_devices", 4)
+    engine = MoveEngine()
+    for index in range(10):
+        fs.create_file("/library/album" + str(index) + "/t1.flac")
+        engine.move(Path("/library/album" + str(index) + "/t1.flac"), Path("/library/album" + str(index) + "/t2.flac"))
+    assert(len(engine._devices) == 4)
+    assert(Path("/library/album9") in engine._devices)
@@ -0,0 +1,111 @@
+import json
+from pathlib import Path
+
+from plan import Operation
+from plan import AlbumPlan
+from plan import LibraryPlan
+from plan import apply_plan
+from plan import operation_batches
+from plan import PlanApplier
+from plan import read_album_plans
+from plan import write_album_plans
+from main import plan_album_folder
+from main import plan_library
+from main import iter_album_plans
+from main import iter_deepest_audio_folders
+
+_extra_files = {"scans/back.jpg": "back"}
+
+def test_plan_album_folder_does_not_touch_disk(fs, create_album):
+    album_path = Path("/library/album")
+    create_album(album_path, extra_files = _extra_files)
+    plan = plan_album_folder(album_path)
+    kinds = [operation.kind for operation in plan.operations]
+    assert(Operation.MKDIR in kinds)
+    assert(Operation.MOVE in kinds)
+    assert(Operation.UNLINK in kinds)
+    assert(Operation.RMDIR in kinds)
+    assert(Operation(Operation.UNLINK, album_path / "t1.m3u") in plan.operations)
+    assert(Operation(Operation.MOVE, album_path / "notes.txt", album_path / "Misc" / "notes.txt") in plan.operations)
+    assert(not (album_path / "Artwork").exists())
+    assert((album_path / "t1.m3u").exists())
+    assert((album_path / "scans" / "front.jpg").exists())
+
+def test_apply_plan(fs, create_album):
+    library_path = Path("/library")
+    create_album(library_path / "album1", extra_files = _extra_files)
+    create_album(library_path / "album2", extra_files = _extra_files)
+    plan = plan_library(library_path)
+    assert(len(plan.albums) == 2)
+    apply_plan(plan)
+    for album in ["album1", "album2"]:
+        album_path = library_path / album
+        assert((album_path / "t1.flac").exists())
+        assert((album_path / "Artwork" / "front.jpg").exists())
+        assert((album_path / "Artwork" / "back.jpg").exists())
+        assert((album_path / "Misc" / "notes.txt").exists())
+        assert(not (album_path / "t1.m3u").exists())
+        assert(not (album_path / "scans").exists())
+
+def test_library_plan_json_round_trip(fs):
+    album_plan = AlbumPlan(Path("/library/album"))
+    album_plan.add(Operation.MKDIR, Path("/library/album/Misc"))
+    album_plan.add(Operation.MOVE, Path("/library/album/a.txt"), Path("/library/album/Misc/a.txt"))
+    plan = LibraryPlan([album_plan, AlbumPlan(Path("/library/empty"))])
+    plan.save(Path("/plan.json"))
+    loaded_plan = LibraryPlan.load(Path("/plan.json"))
+    assert(len(loaded_plan.albums) == 1)
+    assert(loaded_plan.albums[0].path == album_plan.path)
+    assert(loaded_plan.albums[0].operations == album_plan.operations)
+    assert("move /library/album/a.txt -> /library/album/Misc/a.txt" in plan.describe())
+
+def test_album_plans_are_streamed(fs, create_album):
+    library_path = Path("/library")
+    create_album(library_path / "album1", extra_files = _extra_files)
+    create_album(library_path / "album2", extra_files = _extra_files)
+    write_album_plans(Path("/plan.json"), iter_album_plans(iter_deepest_audio_folders(library_path)))
+    with open("/plan.json", encoding = "utf-8") as file:
+        assert(len(json.load(file)["albums"]) == 2)
+    album_plans = read_album_plans(Path("/plan.json"))
+    first_album = next(album_plans)
+    assert(first_album.operations)
+    assert(not (first_album.path / "Artwork").exists())
+    apply_plan(album_plans)
+    assert(not (first_album.path / "Artwork").exists())
+    assert(len(list(Path("/library").glob("*/Artwork"))) == 1)
+
+def test_operation_batches_keep_dependent_operations_apart(fs):
+    album_path = Path("/library/album")
+    operations = [
+        Operation(Operation.MKDIR, album_path / "Artwork"),
+        Operation(Operation.MOVE, album_path / "scans" / "a.jpg", album_path / "Artwork" / "a.jpg"),
+        Operation(Operation.MOVE, album_path / "scans" / "b.jpg", album_path / "Artwork" / "b.jpg"),
+        Operation(Operation.MOVE, album_path / "notes.txt", album_path / "Misc" / "notes.txt"),
+        Operation(Operation.RMDIR, album_path / "scans"),
+    ]
+    batches = list(operation_batches(operations))
+    assert(batches == [operations[0:1], operations[1:4], operations[4:5]])
+
+def test_applier_groups_independent_operations_by_folder(fs):
+    album_path = Path("/library/album")
+    fs.create_file(album_path / "scans" / "a.jpg")
+    fs.create_file(album_path / "scans" / "b.jpg")
+    fs.create_file(album_path / "notes.txt")
+    fs.create_file(album_path / "info.nfo")
+    operations = [
+        Operation(Operation.MKDIR, album_path / "Artwork"),
+        Operation(Operation.MKDIR, album_path / "Misc"),
+        Operation(Operation.MOVE, album_path / "scans" / "a.jpg", album_path / "Artwork" / "a.jpg"),
+        Operation(Operation.MOVE, album_path / "notes.txt", album_path / "Misc" / "notes.txt"),
+        Operation(Operation.MOVE, album_path / "scans" / "b.jpg", album_path / "Artwork" / "b.jpg"),
+        Operation(Operation.MOVE, album_path / "info.nfo", album_path / "Misc" / "info.nfo"),
+        Operation(Operation.RMDIR, album_path / "scans"),
+    ]
+    applied = []
+    class RecordingApplier(PlanApplier):
+        def apply_operation(self, operation):
+            applied.append(operation)
+            super().apply_operation(operation)
+    RecordingApplier().apply_album(AlbumPlan(album_path, operations))
+    assert(applied == [operations[index] for index in [0, 1, 2, 4, 3, 5, 6]])
+    assert(sorted(path.name for path in album_path.iterdir()) == ["Artwork", "Misc"])
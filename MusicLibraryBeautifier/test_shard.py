@@ -0,0 +1,84 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import cli
+from main import iter_deepest_audio_folders
+from shard import Shard
+from shard import iter_shard_albums
+from shard import merge_manifests
+
+def _create_library(library_path: Path, create_album):
+    albums = []
+    for artist in range(12):
+        for album in range(2):
+            albums.append(library_path / ("artist" + str(artist)) / ("album" + str(album)))
+            create_album(albums[-1])
+    create_album(library_path / "artist0" / "set" / "CD1")
+    create_album(library_path / "artist0" / "set" / "CD2")
+    albums.append(library_path / "artist0" / "set")
+    return albums
+
+def test_parse_shard():
+    shard = Shard.parse("2/4")
+    assert((shard.index, shard.count) == (2, 4))
+    assert(str(shard) == "2/4")
+    assert(shard.file_name(".beautifier_state.json") == ".beautifier_state.shard-2-of-4.json")
+    for text in ["4/4", "-1/4", "1", "a/b"]:
+        try:
+            Shard.parse(text)
+            assert(False)
+        except ValueError:
+            pass
+
+def test_shards_partition_the_library(fs, create_album):
+    library_path = Path("/library")
+    albums = _create_library(library_path, create_album)
+    shard_albums = [list(iter_shard_albums(library_path, Shard(index, 3))) for index in range(3)]
+    assert(all(shard_albums))
+    assert(sorted(sum(shard_albums, [])) == sorted(albums) == sorted(iter_deepest_audio_folders(library_path)))
+
+def test_albums_in_library_root_belong_to_first_shard(fs, create_album):
+    library_path = Path("/library")
+    create_album(library_path / "CD1")
+    create_album(library_path / "CD2")
+    assert(list(iter_shard_albums(library_path, Shard(0, 2))) == [library_path])
+    assert(list(iter_shard_albums(library_path, Shard(1, 2))) == [])
+
+def test_merge_manifests():
+    def manifest(index, beautified, errors = {}):
+        return {"library": "/library", "shard": index, "count": 3, "beautified_count": len(beautified),
+                "beautified": beautified, "errors": errors}
+    merged = merge_manifests([manifest(0, ["/library/b/album"]), manifest(2, ["/library/a/album"], {"/library/a/other": "error"})])
+    assert(merged["beautified_count"] == 2)
+    assert(merged["beautified"] == ["/library/a/album", "/library/b/album"])
+    assert(merged["errors"] == {"/library/a/other": "error"})
+    assert(merged["missing_shards"] == [1])
+    for manifests in [[manifest(0, []), manifest(0, [])],
+                      [manifest(0, ["/library/a/set"]), manifest(1, ["/library/a/set/CD1"])]]:
+        try:
+            merge_manifests(manifests)
+            assert(False)
+        except ValueError:
+            pass
+
+def test_shards_run_in_parallel_processes(tmp_path, capsys, create_album):
+    library_path = tmp_path / "library"
+    albums = _create_library(library_path, create_album)
+    main_path = Path(__file__).parent / "main.py"
+    workers = [subprocess.Popen([sys.executable, str(main_path), str(library_path), "--incremental", "--shard", str(index) + "/3"],
+                                stdout = subprocess.DEVNULL)
+               for index in range(3)]
+    assert([worker.wait() for worker in workers] == [0, 0, 0])
+    manifests = sorted(library_path.glob(".beautifier_manifest.shard-*-of-3.json"))
+    assert(len(manifests) == 3)
+    assert(len(list(library_path.glob(".beautifier_state.shard-*-of-3.json"))) == 3)
+    assert(cli.main(["merge"] + list(map(str, manifests)) + ["--output", str(tmp_path / "merged.json")]) == 0)
+    assert("Beautified albums: " + str(len(albums)) in capsys.readouterr().out)
+    with open(tmp_path / "merged.json", encoding = "utf-8") as file:
+        assert(json.load(file)["beautified"] == sorted(map(str, albums)))
+    for album_path in albums[:-1]:
+        assert((album_path / "Misc" / "notes.txt").exists())
+    assert((library_path / "artist0" / "set" / "CD 1" / "t1.flac").exists())
+    assert((library_path / "artist0" / "set" / "Misc" / "CD 1" / "notes.txt").exists())
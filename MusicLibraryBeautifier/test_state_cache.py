@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from state_cache import AlbumStateCache
+from cue import CueCache
+from dedup import HashCache
+from main import beautify_library
+from main import iter_deepest_audio_folders
+from main import main
+
+def _create_library(fs, library_path: Path):
+    fs.create_file(library_path / "artist" / "album1" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album1" / "notes.txt")
+    fs.create_file(library_path / "artist" / "album2" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album2" / "front.jpg")
+
+def test_unchanged_albums_are_skipped(fs):
+    library_path = Path("/library")
+    _create_library(fs, library_path)
+    state_cache = AlbumStateCache(library_path)
+    report = beautify_library(library_path, state_cache = state_cache)
+    assert(len(report.beautified) == 2)
+    state_cache.save()
+
+    state_cache = AlbumStateCache(library_path)
+    assert(len(state_cache) == 2)
+    assert(library_path / "artist" / "album1" in state_cache)
+    assert(list(iter_deepest_audio_folders(library_path, state_cache)) == [])
+    assert(beautify_library(library_path, state_cache = state_cache).beautified == [])
+
+def test_changed_album_is_beautified_again(fs):
+    library_path = Path("/library")
+    _create_library(fs, library_path)
+    state_cache = AlbumStateCache(library_path)
+    beautify_library(library_path, state_cache = state_cache)
+    fs.create_file(library_path / "artist" / "album2" / "rip.log")
+    report = beautify_library(library_path, state_cache = state_cache)
+    assert(report.beautified == [library_path / "artist" / "album2"])
+    assert((library_path / "artist" / "album2" / "Misc" / "rip.log").exists())
+
+def test_corrupted_state_file_is_ignored(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / ".beautifier_state.json", contents = "{not json")
+    assert(len(AlbumStateCache(library_path)) == 0)
+
+def test_change_inside_disc_folder_is_noticed(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist" / "set" / "CD1" / "t1.flac")
+    fs.create_file(library_path / "artist" / "set" / "CD2" / "t1.flac")
+    state_cache = AlbumStateCache(library_path)
+    assert(beautify_library(library_path, state_cache = state_cache).beautified == [library_path / "artist" / "set"])
+    assert(list(iter_deepest_audio_folders(library_path, state_cache)) == [])
+    fs.create_file(library_path / "artist" / "set" / "CD 2" / "notes.txt")
+    report = beautify_library(library_path, state_cache = state_cache)
+    assert(report.beautified == [library_path / "artist" / "set"])
+    assert((library_path / "artist" / "set" / "Misc" / "CD 2" / "notes.txt").exists())
+
+def test_tool_files_in_a_root_album_stay_and_do_not_change_it(fs, capsys):
+    library_path = Path("/library")
+    fs.create_file(library_path / "CD1" / "t1.flac")
+    fs.create_file(library_path / "CD2" / "t1.flac")
+    fs.create_file(library_path / "notes.txt")
+    for beautified_count in [1, 0]:
+        assert(main([str(library_path), "--incremental", "--journal"]) == 0)
+        assert("Beautified albums: " + str(beautified_count) in capsys.readouterr().out)
+    assert(sorted(path.name for path in library_path.iterdir()) ==
+           [".beautifier_state.json", "CD 1", "CD 2", "Misc"])
+    assert([path.name for path in (library_path / "Misc").iterdir()] == ["notes.txt"])
+
+def test_cache_files_of_another_version_are_ignored(fs):
+    for cache_type, name in [(HashCache, "hashes"), (CueCache, "sheets")]:
+        fs.create_file("/" + name + ".json", contents = '{"version": 0, "' + name + '": {"1:2:3": "x"}}')
+        assert(len(cache_type(Path("/" + name + ".json"))) == 0)
+    fs.create_file("/library/.beautifier_state.json", contents = '{"version": 2, "albu')
+    assert(len(AlbumStateCache(Path("/library"))) == 0)
+    cache = HashCache(Path("/hashes.json"))
+    cache._hashes["1:2:3:4"] = "digest"
+    cache._changed = True
+    cache.save()
+    assert(len(HashCache(Path("/hashes.json"))) == 1)
+    assert(not Path("/hashes.json.tmp").exists())
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import instrumentation
+from watcher import FolderDebouncer
+from watcher import affected_album_folders
+from watcher import process_settled_folders
+from state_cache import AlbumStateCache
+
+def test_folder_debouncer(fs):
+    debouncer = FolderDebouncer(2.0)
+    debouncer.add(Path("/library/artist/album"), 10.0)
+    debouncer.add(Path("/library/artist/album/scans"), 10.5)
+    debouncer.add(Path("/library/other"), 11.5)
+    assert(debouncer.pop_settled(11.0) == [])
+    debouncer.add(Path("/library/artist/album"), 11.0)
+    assert(debouncer.pop_settled(13.0) == [Path("/library/artist/album")])
+    assert(len(debouncer) == 1)
+    assert(debouncer.pop_settled(14.0) == [Path("/library/other")])
+
+def test_affected_album_folders(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist" / "album1" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album1" / "scans" / "front.jpg")
+    fs.create_file(library_path / "artist" / "album2" / "CD1" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album2" / "CD2" / "t1.mp3")
+    assert(affected_album_folders(library_path / "artist" / "album1" / "scans", library_path) == [library_path / "artist" / "album1"])
+    assert(affected_album_folders(library_path / "artist" / "album2", library_path) == [library_path / "artist" / "album2"])
+    assert(affected_album_folders(library_path / "artist" / "album2" / "CD1", library_path) == [library_path / "artist" / "album2"])
+    assert(affected_album_folders(library_path / "artist" / "missing", library_path) == [])
+
+def test_affected_album_folders_lists_each_folder_once(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist" / "album1" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album1" / "scans" / "booklet" / "front.jpg")
+    fs.create_file(library_path / "artist" / "album2" / "CD1" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album2" / "CD1" / "scans" / "back.jpg")
+    fs.create_file(library_path / "artist" / "album2" / "CD2" / "t1.mp3")
+    recorder = instrumentation.enable(instrumentation.Recorder())
+    try:
+        with instrumentation.stage("album1"):
+            assert(affected_album_folders(library_path / "artist" / "album1" / "scans" / "booklet", library_path) ==
+                   [library_path / "artist" / "album1"])
+        with instrumentation.stage("album2"):
+            assert(affected_album_folders(library_path / "artist" / "album2" / "CD1" / "scans", library_path) ==
+                   [library_path / "artist" / "album2"])
+    finally:
+        instrumentation.disable()
+    assert(recorder.stage_totals["album1"].counters["listdir"] == 3)
+    assert(recorder.stage_totals["album2"].counters["listdir"] == 4)
+
+def test_process_settled_folders_skips_own_changes(fs):
+    library_path = Path("/library")
+    fs.create_file(library_path / "artist" / "album" / "t1.mp3")
+    fs.create_file(library_path / "artist" / "album" / "front.jpg")
+    state_cache = AlbumStateCache(library_path)
+    album_path = library_path / "artist" / "album"
+    assert(process_settled_folders([album_path], library_path, state_cache) == [album_path])
+    assert((album_path / "Artwork" / "front.jpg").exists())
+    assert(process_settled_folders([album_path / "Artwork"], library_path, state_cache) == [])
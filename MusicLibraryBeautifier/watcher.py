@@ -0,0 +1,126 @@
+import os
+import queue
+import time
+from pathlib import Path
+
+from main import _beautify_album_folder_safely, _collect_scan, _scan_audio_folders, is_disc_folder_name
+from state_cache import AlbumStateCache
+
+_default_settle_delay = 2.0
+_poll_interval = 0.5
+
+class FolderDebouncer:
+    # Collects filesystem events per folder and reports a folder only once it has been quiet
+    # for settle_delay seconds, so a copy of a whole album results in a single beautification.
+    def __init__(self, settle_delay: float = _default_settle_delay):
+        self.settle_delay = settle_delay
+        self._last_events = {}
+
+    def __len__(self):
+        return len(self._last_events)
+
+    def add(self, folder: Path, timestamp: float):
+        self._last_events[folder] = timestamp
+
+    def pop_settled(self, now: float):
+        settled = [folder for folder, timestamp in self._last_events.items() if now - timestamp >= self.settle_delay]
+        for folder in settled:
+            del self._last_events[folder]
+        # Parents first, so a folder whose ancestor is handled in the same batch is skipped.
+        settled.sort(key = lambda folder: len(folder.parts))
+        result = []
+        for folder in settled:
+            if not any(handled == folder or handled in folder.parents for handled in result):
+                result.append(folder)
+        return result
+
+def event_folder(path: Path, is_directory: bool):
+    return path if is_directory else path.parent
+
+def affected_album_folders(folder: Path, library_path: Path):
+    # A settled folder is either a freshly copied tree containing albums, or something inside
+    # an existing album (a new scans folder, a late log file); in the latter case that album is returned.
+    # Discovery climbs from the folder one parent at a time, handing each parent the result for the folder
+    # below, so every folder is listed once. A disc found on its own is checked against its parent,
+    # since a multi-disc set is beautified as one album.
+    path = folder
+    albums, has_audio = _collect_scan(_scan_audio_folders(folder))
+    while True:
+        affected = [album for album in albums if album == folder or folder in album.parents or album in folder.parents]
+        if affected and (affected != [path] or not is_disc_folder_name(path.name)):
+            return affected
+        parent = path.parent
+        if parent == library_path or library_path not in parent.parents:
+            return affected
+        albums, has_audio = _collect_scan(_scan_audio_folders(parent, known = {path: (albums, has_audio)}))
+        path = parent
+
+def _is_unchanged(state_cache: AlbumStateCache, album_path: Path):
+    try:
+        with os.scandir(album_path) as iterator:
+            return state_cache.is_unchanged(album_path, list(iterator), is_disc_folder_name)
+    except OSError:
+        return False
+
+def process_settled_folders(folders, library_path: Path, state_cache: AlbumStateCache):
+    beautified = []
+    for folder in folders:
+        for album_path in affected_album_folders(folder, library_path):
+            # Events caused by our own moves settle too; the fingerprint tells them apart from new changes.
+            if _is_unchanged(state_cache, album_path):
+                continue
+            _, error = _beautify_album_folder_safely(album_path)
+            if error is not None:
+                print("Failed: " + str(album_path) + ": " + error)
+                continue
+            state_cache.update(album_path, is_disc_folder_name)
+            beautified.append(album_path)
+    return beautified
+
+def _create_observer(library_path: Path, events: queue.Queue):
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        raise RuntimeError("Watch mode requires the watchdog package: pip install watchdog")
+
+    class EventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type in ("opened", "closed_no_write"):
+                return
+            events.put((Path(event.src_path), event.is_directory))
+            destination = getattr(event, "dest_path", "")
+            if destination:
+                events.put((Path(destination), event.is_directory))
+
+    observer = Observer()
+    observer.schedule(EventHandler(), str(library_path), recursive = True)
+    return observer
+
+def watch(library_path: Path, settle_delay: float = _default_settle_delay):
+    library_path = Path(os.path.abspath(library_path))
+    state_cache = AlbumStateCache(library_path)
+    events = queue.Queue()
+    debouncer = FolderDebouncer(settle_delay)
+    observer = _create_observer(library_path, events)
+    observer.start()
+    print("Watching: " + str(library_path))
+    try:
+        while True:
+            try:
+                path, is_directory = events.get(timeout = _poll_interval)
+                folder = event_folder(path, is_directory)
+                if folder != library_path:
+                    debouncer.add(folder, time.monotonic())
+            except queue.Empty:
+                pass
+            settled = debouncer.pop_settled(time.monotonic())
+            if settled:
+                process_settled_folders(settled, library_path, state_cache)
+                state_cache.save()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        state_cache.save()